@@ -0,0 +1,374 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import mcesre
+
+
+def bench_tokenize():
+    """Tokenizer time per byte should stay flat from 1 KB to 10 MB."""
+    with open("scripts/cursive.sh", "r", encoding="utf8") as f:
+        src = f.read()
+
+    for size in [10**3, 10**4, 10**5, 10**6, 10**7]:
+        code = (src * (size // len(src) + 1))[:size]
+
+        t0 = time.perf_counter()
+        tokens = mcesre.Compiler._tokenize(code)
+        dt = time.perf_counter() - t0
+
+        print(f"{size // 1000:>6} KB  {dt:8.3f} s  {dt / size * 1e9:6.1f} ns/byte  tokens: {len(tokens)}")
+
+
+def bench_vm():
+    """Best-of-5 run time for the bundled scripts, with and without memoization."""
+    programs = {
+        "scripts/curves.sh": None,
+        "scripts/penrose.sh": None,
+        # straight-line code, dominated by instruction dispatch
+        "arithmetic": "$0,1+P," * 40000,
+        "moves": ">^<v" * 20000,
+        "loop": "50000:$0P",
+    }
+
+    for name, code in programs.items():
+        if code is None:
+            with open(name, "r", encoding="utf8") as f:
+                code = f.read()
+        prog = mcesre.Compiler.compile(code)
+
+        for memoize in [True, False]:
+            best = float("inf")
+            for _ in range(5):
+                prog.mem = dict() if memoize else None
+                plot = mcesre.Plot()
+
+                t0 = time.perf_counter()
+                plot.run(prog)
+                best = min(best, time.perf_counter() - t0)
+
+            print(f"{name:<20} memoize={memoize!s:<5}  {best * 1000:8.1f} ms  points: {len(plot.verts)}")
+
+
+def bench_instanced():
+    """Run time and buffered points for deep self-similar calls, expanded or instanced."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        prog = mcesre.Compiler.compile(f.read())
+
+    for fn, depth in [("$dra", 16), ("$c", 15)]:
+        for instanced in [False, True]:
+            prog.mem = dict()
+            plot = mcesre.Plot(instanced=instanced)
+
+            t0 = time.perf_counter()
+            plot.run(prog, fn, depth)
+            t1 = time.perf_counter()
+            codes, verts = plot.get_path()
+            t2 = time.perf_counter()
+
+            print(f"{fn} {depth}  instanced={instanced!s:<5}  run {(t1 - t0) * 1000:7.1f} ms"
+                  f"  get_path {(t2 - t1) * 1000:7.1f} ms  buffered: {plot.size:>7}  points: {len(codes)}")
+
+
+def bench_memo():
+    """Run time and cache counters for curves.sh under shrinking memo budgets."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        prog = mcesre.Compiler.compile(f.read())
+
+    for budget in [256 << 20, 1 << 20, 64 << 10]:
+        prog.mem = mcesre.MemoCache(budget)
+        plot = mcesre.Plot()
+
+        t0 = time.perf_counter()
+        plot.run(prog, "$dra", 14)
+        dt = time.perf_counter() - t0
+
+        stats = "  ".join(f"{k}: {v}" for k, v in prog.mem.stats().items())
+        print(f"budget {budget >> 10:>7} KB  {dt * 1000:8.1f} ms  {stats}")
+
+
+def bench_compile():
+    """Compile time for cursive.sh, from source and from the on-disk cache."""
+    with open("scripts/cursive.sh", "r", encoding="utf8") as f:
+        src = f.read()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for label, kwargs in [("source", {}), ("cache miss", {"cache_dir": cache_dir}), ("cache hit", {"cache_dir": cache_dir})]:
+            t0 = time.perf_counter()
+            mcesre.Compiler.compile(src, **kwargs)
+            dt = time.perf_counter() - t0
+            print(f"{label:<12} {dt * 1000:8.2f} ms")
+
+
+def bench_lod():
+    """Points and run time for the dragon curve at decreasing output resolution."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        src = f.read()
+
+    for tolerance in [None, 4, 16, 64]:
+        prog = mcesre.Compiler.compile(src)
+        plot = mcesre.Plot()
+
+        t0 = time.perf_counter()
+        plot.run(prog, "$dra", 16, tolerance=tolerance)
+        dt = time.perf_counter() - t0
+
+        print(f"tolerance {tolerance!s:<5}  {dt * 1000:8.1f} ms  points: {plot.size:>7}  chords: {plot.chords}")
+
+
+def bench_viewport():
+    """Run plus get_path time and output points for the dragon curve in shrinking windows."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        src = f.read()
+
+    # the depth 16 dragon spans roughly (-480, -1690) to (960, 480)
+    for half in [None, 200, 20, 2]:
+        viewport = None if half is None else (-half, -half, half, half)
+        prog = mcesre.Compiler.compile(src)
+        plot = mcesre.Plot()
+
+        t0 = time.perf_counter()
+        plot.run(prog, "$dra", 16, viewport=viewport)
+        codes, verts = plot.get_path()
+        dt = time.perf_counter() - t0
+
+        print(f"viewport {viewport!s:<24}  {dt * 1000:8.1f} ms  points: {len(codes)}")
+
+
+def bench_parallel():
+    """Serial and parallel run time for curves.sh at larger depths, top-level contexts spread over processes."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        src = f.read()
+    src = src.replace("(10$dra!)", "(16$dra!)").replace("(8z 4$hil!)", "(8z 6$hil!)")
+
+    for memoize in [True, False]:
+        for workers in [0, 2, 4]:
+            prog = mcesre.Compiler.compile(src)
+            if not memoize:
+                prog.mem = None
+            plot = mcesre.Plot()
+
+            t0 = time.perf_counter()
+            if workers:
+                plot.run_parallel(prog, workers)
+            else:
+                plot.run(prog)
+            dt = time.perf_counter() - t0
+
+            print(f"memoize={memoize!s:<5} workers {workers}  {dt * 1000:8.1f} ms  points: {plot.size}")
+
+
+def bench_sweep():
+    """Time to render every dragon depth up to 16, one after another and through `Plot.sweep`."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        src = f.read()
+    arglist = [(i,) for i in range(17)]
+
+    for workers in [0, 2, 4]:
+        prog = mcesre.Compiler.compile(src)
+        plot = mcesre.Plot()
+
+        t0 = time.perf_counter()
+        if workers:
+            points = sum(len(codes) for _, codes, _ in plot.sweep(prog, "$dra", arglist, workers))
+        else:
+            points = 0
+            for args in arglist:
+                frame = plot.copy()
+                frame.run(prog, "$dra", *args)
+                points += len(frame.get_path()[0])
+        dt = time.perf_counter() - t0
+
+        print(f"workers {workers}  {dt * 1000:8.1f} ms  points: {points}")
+
+
+def bench_stream():
+    """Run time and largest plot buffer for the depth 16 dragon, kept whole or streamed in chunks."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        src = f.read()
+
+    for memoize in [True, False]:
+        for chunk in [None, 1 << 16, 1 << 12]:
+            prog = mcesre.Compiler.compile(src)
+            plot = mcesre.Plot()
+            peak = 0
+
+            def sink(codes, verts):
+                nonlocal peak
+                peak = max(peak, plot.size)
+
+            t0 = time.perf_counter()
+            if chunk is None:
+                plot.run(prog, "$dra", 16, memoize=memoize)
+                plot.get_path()
+                peak = plot.size
+            else:
+                plot.run(prog, "$dra", 16, memoize=memoize, sink=sink, chunk=chunk)
+            dt = time.perf_counter() - t0
+
+            print(f"memoize={memoize!s:<5} chunk {chunk!s:<6}  {dt * 1000:8.1f} ms  buffered: {peak}")
+
+
+def bench_sinks():
+    """Time and file size writing the depth 16 dragon through each output sink."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        src = f.read()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, mode, make in [("memory", None, lambda f: mcesre.MemorySink()),
+                                 ("svg", "w", mcesre.SVGSink),
+                                 ("binary", "wb", mcesre.BinarySink)]:
+            prog = mcesre.Compiler.compile(src)
+            path = f"{tmp}/out.{name}"
+
+            t0 = time.perf_counter()
+            with open(path, mode) if mode else tempfile.TemporaryFile() as f, make(f) as sink:
+                mcesre.Plot().run(prog, "$dra", 16, sink=sink)
+            dt = time.perf_counter() - t0
+
+            size = os.path.getsize(path) if mode else 0
+            print(f"{name:<8} {dt * 1000:8.1f} ms  {size / 1e6:8.1f} MB")
+
+
+def bench_save():
+    """Save and load time for the depth 16 dragon path, float64 and float32 vertices."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        prog = mcesre.Compiler.compile(f.read())
+    plot = mcesre.Plot()
+    plot.run(prog, "$dra", 16)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in ["float64", "float32"]:
+            path = f"{tmp}/dragon.{dtype}"
+
+            t0 = time.perf_counter()
+            plot.save(path, dtype)
+            t1 = time.perf_counter()
+            codes, verts = mcesre.load_path(path)
+            t2 = time.perf_counter()
+            verts.sum()
+            t3 = time.perf_counter()
+
+            print(f"{dtype:<8} save {(t1 - t0) * 1000:7.1f} ms  load {(t2 - t1) * 1000:6.2f} ms"
+                  f"  first pass {(t3 - t2) * 1000:6.1f} ms  {os.path.getsize(path) / 1e6:5.1f} MB")
+
+
+def bench_raster():
+    """Time to rasterize curves.sh and the depth 16 dragon to PNG at increasing scale."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        src = f.read()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for fn, args in [(None, ()), ("$dra", (16,))]:
+            plot = mcesre.Plot()
+            plot.run(mcesre.Compiler.compile(src), fn, *args)
+            for scale in [1, 4]:
+                t0 = time.perf_counter()
+                plot.save_png(f"{tmp}/out.png", scale)
+                dt = time.perf_counter() - t0
+                print(f"{fn or 'curves.sh':<10} scale {scale}  {dt * 1000:8.1f} ms  points: {plot.size}")
+
+
+def bench_flatten():
+    """Flattening time for 100k random cubic and quadratic curves at decreasing tolerance."""
+    rng = np.random.default_rng(0)
+    codes = np.tile(np.array([mcesre.Path.CURVE4] * 3 + [mcesre.Path.CURVE3] * 2, dtype="int8"), 50000)
+    codes = np.hstack([[mcesre.Path.MOVETO], codes]).astype("int8")
+    verts = rng.normal(scale=20, size=(len(codes), 2))
+
+    for tolerance in [1, 0.1, 0.01]:
+        t0 = time.perf_counter()
+        out_codes, out_verts, lengths = mcesre.flatten(codes, verts, tolerance)
+        dt = time.perf_counter() - t0
+        print(f"tolerance {tolerance:<5}  {dt * 1000:8.1f} ms  points: {len(out_codes):>8}  length: {lengths.sum():.0f}")
+
+
+def bench_simplify():
+    """Points left and time for exact merging and Ramer-Douglas-Peucker on the bundled curves."""
+    with open("scripts/curves.sh", "r", encoding="utf8") as f:
+        src = f.read()
+
+    for fn, args in [(None, ()), ("$hil", (7,)), ("$c", (14,)), ("$dra", (16,))]:
+        plot = mcesre.Plot()
+        plot.run(mcesre.Compiler.compile(src), fn, *args)
+        for merge, tolerance in [(False, None), (True, None), (True, 0.5), (True, 2)]:
+            t0 = time.perf_counter()
+            codes, verts = plot.get_path(merge=merge, tolerance=tolerance)
+            dt = time.perf_counter() - t0
+            print(f"{fn or 'curves.sh':<10} merge={merge!s:<5} tolerance {tolerance!s:<4}  {dt * 1000:8.1f} ms  points: {len(codes)}")
+
+
+def bench_combine():
+    """Ligature path merging in render.py over every pair of cursive.sh glyph paths, then longer runs of joined glyphs."""
+    import render
+
+    paths = [var._path for char in render.chars.values() for var in char.variants]
+    t0 = time.perf_counter()
+    merged = sum(render.combine(a, b) is not None for a in paths for b in paths)
+    dt = time.perf_counter() - t0
+    print(f"glyph pairs {len(paths) ** 2:>7}  {dt * 1000:8.1f} ms  merged: {merged}")
+
+    rng = np.random.default_rng(0)
+    for glyphs in [4, 16, 64]:
+        runs = [sum((paths[k] for k in rng.integers(len(paths), size=glyphs)), []) for _ in range(200)]
+        t0 = time.perf_counter()
+        for a, b in zip(runs, runs[1:]):
+            render.combine(a, b)
+        dt = time.perf_counter() - t0
+        print(f"{glyphs:>3} glyph runs  {sum(map(len, runs)) // len(runs):>5} symbols  {dt / (len(runs) - 1) * 1e6:8.1f} us/call")
+
+
+def bench_layout():
+    """Lines of random cursive.sh words drawn through `$call_n` and placed by render.Layout."""
+    import render
+
+    rng = np.random.default_rng(0)
+    ids = [id for id in render.chars if type(id) is int]
+    for words in [4, 16, 64]:
+        code = []
+        for _ in range(words):
+            for k in rng.integers(len(ids), size=5):
+                code.extend(render.chars[ids[k]].path())
+            code.append(render.space)
+        code = render.sub(code)
+        # glyphs are measured on first use
+        render.layout.place(mcesre.Plot(), code)
+
+        for name in ["vm", "layout"]:
+            plot = mcesre.Plot()
+            plot.run_code(".4i")
+            t0 = time.perf_counter()
+            if name == "vm" or not render.layout.place(plot, code):
+                plot.run(render.prog, "$call_n", len(code), *code)
+            dt = time.perf_counter() - t0
+            print(f"{words:>3} words  {name:<6}  {dt * 1000:8.1f} ms  points: {plot.size}")
+
+
+benchmarks = {
+    "tokenize": bench_tokenize,
+    "compile": bench_compile,
+    "vm": bench_vm,
+    "instanced": bench_instanced,
+    "memo": bench_memo,
+    "lod": bench_lod,
+    "viewport": bench_viewport,
+    "parallel": bench_parallel,
+    "sweep": bench_sweep,
+    "stream": bench_stream,
+    "sinks": bench_sinks,
+    "save": bench_save,
+    "raster": bench_raster,
+    "flatten": bench_flatten,
+    "simplify": bench_simplify,
+    "combine": bench_combine,
+    "layout": bench_layout,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or benchmarks:
+        print(f"# {name}")
+        benchmarks[name]()
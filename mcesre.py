@@ -1,9 +1,20 @@
+import array
 import collections
-import copy
+import concurrent.futures
+import functools
+import hashlib
+import math
+import multiprocessing
 import operator
+import os
+import pickle
+import queue
 import re
+import struct
 import sys
+import threading
 import time
+import zlib
 
 import numpy as np
 
@@ -22,398 +33,886 @@ phi = (1 + 5**0.5)*0.5
 P = lambda x, y: np.array([x, y], dtype="double")
 
 class State:
+    """Pen state: data stack, loop iteration and the affine transform.
+
+    The transform is kept as six floats, the linear part `a b / c d` applied
+    to local moves and the pen position `x, y`, so cloning and composing
+    never touch NumPy.
+    """
+    __slots__ = ("iteration", "path", "stack", "a", "b", "c", "d", "x", "y")
+
     def __init__(self):
         self.iteration = 0
         self.path = []
         self.stack = []
-        self.pos = P(0, 0)
-        self.transformation_matrix = np.array([
-            [1, 0],
-            [0, 1],
-        ], dtype="double")
+        self.a, self.b, self.c, self.d = 1.0, 0.0, 0.0, 1.0
+        self.x, self.y = 0.0, 0.0
 
     def clone(self):
-        c = copy.deepcopy(self)
-        c.path.clear()
+        c = State.__new__(State)
+        c.iteration = self.iteration
+        c.path = []
+        c.stack = self.stack.copy()
+        c.a, c.b, c.c, c.d = self.a, self.b, self.c, self.d
+        c.x, c.y = self.x, self.y
         return c
 
-    def transform(self, p):
-        return self.transformation_matrix @ p
+    @property
+    def pos(self):
+        return P(self.x, self.y)
 
-    def stretch_x(self, k):
-        mat = np.array([
-            [k, 0],
-            [0, 1],
+    @pos.setter
+    def pos(self, p):
+        self.x, self.y = float(p[0]), float(p[1])
+
+    @property
+    def transformation_matrix(self):
+        return np.array([
+            [self.a, self.b],
+            [self.c, self.d],
         ], dtype="double")
 
-        self.transformation_matrix = self.transformation_matrix @ mat
+    @transformation_matrix.setter
+    def transformation_matrix(self, m):
+        (a, b), (c, d) = m
+        self.a, self.b, self.c, self.d = float(a), float(b), float(c), float(d)
 
-    def stretch_y(self, k):
-        mat = np.array([
-            [1, 0],
-            [0, k],
-        ], dtype="double")
+    def transform(self, p):
+        return P(self.a * p[0] + self.b * p[1], self.c * p[0] + self.d * p[1])
+
+    def scale(self):
+        """Upper bound on how much the transform stretches a move."""
+        return math.hypot(self.a, self.b, self.c, self.d)
+
+    def stretch(self):
+        """Largest and smallest factor the transform stretches a move by."""
+        return _stretch(self.a, self.b, self.c, self.d)
+
+    def move(self, dx, dy):
+        """Move the pen by local `(dx, dy)`, return the new position."""
+        self.x += self.a * dx + self.b * dy
+        self.y += self.c * dx + self.d * dy
+        return self.x, self.y
+
+    def compose(self, a, b, c, d):
+        """Apply the linear map `a b / c d` before the current one."""
+        a0, b0, c0, d0 = self.a, self.b, self.c, self.d
+        self.a = a0 * a + b0 * c
+        self.b = a0 * b + b0 * d
+        self.c = c0 * a + d0 * c
+        self.d = c0 * b + d0 * d
 
-        self.transformation_matrix = self.transformation_matrix @ mat
+    def stretch_x(self, k):
+        self.a *= k
+        self.c *= k
 
-    def shear_x(self, k):
-        mat = np.array([
-            [1, k],
-            [0, 1],
-        ], dtype="double")
+    def stretch_y(self, k):
+        self.b *= k
+        self.d *= k
 
-        self.transformation_matrix = self.transformation_matrix @ mat
+    def shear_x(self, k):
+        self.b += self.a * k
+        self.d += self.c * k
 
     def shear_y(self, k):
-        mat = np.array([
-            [1, 0],
-            [k, 1],
-        ], dtype="double")
-
-        self.transformation_matrix = self.transformation_matrix @ mat
+        self.a += self.b * k
+        self.c += self.d * k
 
     def rotate(self, a):
-        a = 2 * a * np.pi
-        cos = np.cos(a)
-        sin = np.sin(a)
-        mat = np.array([
-            [cos, -sin],
-            [sin, cos],
-        ], dtype="double")
-
-        self.transformation_matrix = self.transformation_matrix @ mat
+        a = 2 * a * math.pi
+        cos = math.cos(a)
+        sin = math.sin(a)
+        self.compose(cos, -sin, sin, cos)
 
     def translate(self, p):
-        self.pos = self.pos + p
+        self.x += float(p[0])
+        self.y += float(p[1])
         return self.pos
 
 
-class Program:
-    def __init__(self, prog, functions):
-        self.mem = dict()
-        self.prog = prog
-        self.functions = functions
-        self.debug = False
-
-    def _exec(self, plot, state, ip, stack_top, single_statement=False):
-        # print(f"exec > \"{''.join(map(str, prog[ip:ip+4]))}\"", itr)
-        initial_state = state.clone()
-        stack_drop = 0
-
-        def _args(n):
-            assert len(state.stack) >= n
-            args = state.stack[-n:]
-            state.stack = state.stack[:-n]
-            return args
-
-        while ip < len(self.prog):
-            self.debug and print(f"{self.prog[ip]:<4} {ip} {state.pos}  {state.stack}")
-
-            if type(self.prog[ip]) in [int, float]:
-                state.stack.append(self.prog[ip])
-                ip += 1
-                continue
-
-            match self.prog[ip]:
-                case " " | "\n":
-                    if single_statement:
-                        break
-
-                case "$":
-                    arg, = _args(1)
-                    if arg:
-                        state.stack.append(state.stack[stack_top+arg-1])
-                    else:
-                        state.stack.append(state.iteration)
-
-                case "|":
-                    pos = state.pos
-                    state = initial_state.clone()
-                    state.pos = pos
+# Bytecode has one slot per token so function addresses, `$name+k` offsets
+# and `@` keep indexing the token stream. Statement and context terminators
+# come first so the interpreter can test them with a single comparison.
+OPCODES = [
+    " ", "\n", "]", ")", "}", "b",
+    "[", "(", "{", ":", "!", "`",
+    "$", "|", ">", "v", "<", "^", ";", "M", "C", "s", "S",
+    "x", "y", "z", "r", "l", "R", "L", "i", "j", "+", "-", "*", "/", "p", "G",
+    "=", "@", "?", "P",
+]
+OP_PUSH = len(OPCODES)   # push `consts[arg]`
+OP_TOKEN = OP_PUSH + 1   # anything else, `consts[arg]` holds the token
+OP_TARGET = OP_PUSH + 2  # where `?` skips to, `?` reads it from `jumps`
+OP_STMT_END = OPCODES.index("\n")
+OP_BREAK = OPCODES.index("b")
+OP_ENTER = OPCODES.index("[")
+OP_LAST_ENTER = OPCODES.index("`")
+
+OPCODE = {op: i for i, op in enumerate(OPCODES)}
+
+# `Program.resets` bits
+RESET_STATEMENT = 1
+RESET_CONTEXT = 2
+
+FRAME_ROOT = 0
+FRAME_COMBINE = 1
+FRAME_ISOLATE = 2
+FRAME_DISCARD = 3
+FRAME_LOOP = 4
+FRAME_CALL = 5
+FRAME_CALL_MEMO = 6
+
+
+class _Cancelled(Exception):
+    """Raised in the producer when the consumer of `Plot.stream` goes away."""
+
+
+class _Unsplittable(Exception):
+    """Raised when a parallel run cannot match the serial one."""
+
+
+class Frame:
+    """One level of the interpreter's frame stack.
+
+    `initial_state` is only needed by `|`, frames that cannot reach one skip
+    the snapshot. `ret` and `data` hold what the parent needs once the frame
+    is done, depending on `kind`. `chord` holds the plot mark, pen
+    position, call key, transform and stack top on entry of a call whose
+    extent is not known yet while a level-of-detail tolerance is set.
+    """
+    __slots__ = ("parent", "kind", "depth", "plot", "state", "initial_state", "stack_top", "stack_drop",
+                 "single_statement", "ret", "data", "chord")
+
+    def __init__(self, parent, kind, plot, state, stack_top, single_statement, snapshot=True, ret=None, data=None,
+                 chord=None):
+        self.parent = parent
+        self.kind = kind
+        self.depth = parent.depth + 1 if parent else 0
+        self.plot = plot
+        self.ret = ret
+        self.data = data
+        self.chord = chord
+        self.enter(state, stack_top, single_statement, snapshot)
+
+    def enter(self, state, stack_top, single_statement, snapshot):
+        self.state = state
+        self.initial_state = state.clone() if snapshot else None
+        self.stack_top = stack_top
+        self.stack_drop = 0
+        self.single_statement = single_statement
+
+    def args(self, n):
+        stack = self.state.stack
+        assert len(stack) >= n
+        args = stack[-n:]
+        del stack[-n:]
+        return args
+
+
+class MemoCache:
+    """Least recently used store for memoized calls, bounded in bytes.
+
+    Sizes are estimated from the vertex and code arrays and the returned
+    stack, which is what dominates an entry.
+    """
+    def __init__(self, max_bytes=256 << 20):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-                case "[":
-                    tm = state.transformation_matrix
-                    state, ip = self._exec(plot, state, ip + 1, stack_top)
-                    state.transformation_matrix = tm
-
-                case "]":
-                    break
-
-                case "(":
-                    _, ip = self._exec(plot, state.clone(), ip + 1, stack_top)
-                    plot.add_point(Path.MOVETO, state.pos)
-
-                case ")":
-                    break
-
-                case "{":
-                    p0 = len(plot.verts)
-                    st, ip = self._exec(plot, state.clone(), ip + 1, stack_top)
-                    state.pos = st.pos
-                    pos = plot.verts[-1]
-                    plot.cmds = plot.cmds[:p0]
-                    plot.verts = plot.verts[:p0]
-                    plot.add_point(Path.MOVETO, pos)
-
-                case "}":
-                    break
-
-                case ">":
-                    plot.add_point(Path.LINETO, state.translate(state.transform((1, 0))))
-
-                case "v":
-                    plot.add_point(Path.LINETO, state.translate(state.transform((0, -1))))
-
-                case "<":
-                    plot.add_point(Path.LINETO, state.translate(state.transform((-1, 0))))
-
-                case "^":
-                    plot.add_point(Path.LINETO, state.translate(state.transform((0, 1))))
-
-                case ";":
-                    plot.add_point(Path.MOVETO, state.translate(state.transform((1, 0))))
-
-                case "M":
-                    plot.add_point(PATH_MOVE_CUR, plot.verts[-1])
-
-                case "C":
-                    if plot.cmds[-1] == Path.MOVETO:
-                        plot.add_point(PATH_LINK_LAST, state.pos)
-
-                case "s":
-                    assert len(plot.verts) >= 4
-
-                    path = plot.verts[-4:]
-                    plot.verts = plot.verts[:-3]
-                    plot.cmds = plot.cmds[:-3]
-
-                    v1 = path[1]
-                    p = path[0] + path[2] - path[1]
-                    v2 = p - path[3] + path[2]
-
-                    plot.add_point(Path.CURVE4, v1)
-                    plot.add_point(Path.CURVE4, v2)
-                    plot.add_point(Path.CURVE4, p)
-                    state.pos = p
-
-                case "S":
-                    begin = 0
-                    while self.points[begin - 1][0] == Path.LINETO:
-                        begin -= 1
-
-                    # Need at least 2 line segments to make a spline
-                    if -begin >= 2:
-                        curve = self.points[begin:]
-                        self.points = self.points[:begin]
-
-                        v1 = curve[0][1] - self.points[-1][1]
-                        v2 = curve[1][1] - curve[0][1]
-                        v = v1 + v2
-
-                        plot.add_point(Path.CURVE3, curve[0][1] - 0.25 * v)
-                        plot.add_point(Path.CURVE3, curve[0][1])
-
-                        for i in range(1, len(curve)-1):
-                            plot.add_point(Path.CURVE4, curve[i-1][1] + 0.25 * v)
-                            v1 = v2
-                            v2 = curve[i+1][1] - curve[i][1]
-                            v = v1 + v2
-                            plot.add_point(Path.CURVE4, curve[i][1] - 0.25 * v)
-                            plot.add_point(Path.CURVE4, curve[i][1])
-
-
-                        plot.add_point(Path.CURVE3, curve[-2][1] + 0.25 * v)
-                        plot.add_point(Path.CURVE3, curve[-1][1])
-
-                case "x":
-                    state.stretch_x(_args(1)[0])
-                case "y":
-                    state.stretch_y(_args(1)[0])
-                case "z":
-                    v, = _args(1)
-                    state.stretch_x(v)
-                    state.stretch_y(v)
-                case "r":
-                    state.rotate(-_args(1)[0])
-                case "l":
-                    state.rotate(_args(1)[0])
-                case "R":
-                    state.rotate(-0.5+_args(1)[0])
-                case "L":
-                    state.rotate(0.5-_args(1)[0])
-                case "i":
-                    state.shear_x(_args(1)[0])
-                case "j":
-                    state.shear_y(_args(1)[0])
-                case "+":
-                    lhs, rhs = _args(2)
-                    state.stack.append(lhs + rhs)
-                case "-":
-                    lhs, rhs = _args(2)
-                    state.stack.append(lhs - rhs)
-                case "*":
-                    lhs, rhs = _args(2)
-                    state.stack.append(lhs * rhs)
-                case "/":
-                    num, den = _args(2)
-                    state.stack.append(num/den)
-                case "p":
-                    base, exp = _args(2)
-                    state.stack.append(base ** exp)
-                case "G":
-                    lhs, rhs = _args(2)
-                    state.stack.append(lhs > rhs)
-
-                case ":":
-                    start = ip + 1
-                    for n in range(*_args(1)):
-                        state.iteration = n
-                        state, ip = self._exec(plot, state, start, stack_top, single_statement=True)
-                    ip -= 1
-
-                case "=":
-                    stack_drop, *_ = _args(1)
-                    stack_top = len(state.stack) - stack_drop
-
-                case "!":
-                    addr, *_ = _args(1)
-                    state, _ = self._exec(plot, state, addr, stack_top, single_statement=True)
-
-                case "@":
-                    addr, idx = _args(2)
-                    state.stack.append(self.prog[addr + idx])
-
-                case "`":
-                    addr, argc = _args(2)
-                    key = (addr, tuple(state.stack[len(state.stack)-argc:]))
-
-                    if self.mem is not None and key in self.mem:
-                        tra, dpos, verts, cmds, ret = self.mem[key]
-
-                        # for c, p in zip(cmds, verts):
-                        #     plot.add_point(c, state.pos + state.transform(p))
-
-                        if len(verts):
-                            verts = state.transformation_matrix @ verts
-                            verts[0,:] += state.pos[0]
-                            verts[1,:] += state.pos[1]
-
-                        plot.cmds.extend(cmds)
-                        plot.verts.extend(verts.T)
-
-                        state.pos = state.pos + state.transform(dpos)
-                        state.transformation_matrix = state.transformation_matrix @ tra
-
-                        arg0 = len(state.stack)
-                        # print("callm del", state.stack[arg0-argc:arg0], "stack=", state.stack)
-                        del state.stack[arg0-argc:arg0]
-                        state.stack.extend(ret)
-                    else:
-                        p0 = len(plot.verts)
-                        tra0 = np.linalg.inv(state.transformation_matrix)
-                        pos0 = state.pos
-                        arg0 = len(state.stack) - argc
-
-                        state, _ = self._exec(plot, state, addr, stack_top, single_statement=True)
+    @staticmethod
+    def entry_size(key, value):
+        tra, dpos, block, ret = value
+        return 200 + 8 * (len(key[1]) + len(ret)) + block.nbytes
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def __setitem__(self, key, value):
+        self.pop(key)
+        size = self.entry_size(key, value)
+        # an entry over budget would only flush everything else
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.bytes += size
+
+        while self.bytes > self.max_bytes and self.entries:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def __getitem__(self, key):
+        return self.entries[key][0]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return default
+        self.bytes -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
 
-                        if self.mem is not None:
-                            tra = state.transformation_matrix @ tra0
-                            # verts = [tra0 @ (p - pos0) for p in plot.verts[p0:]]
-                            verts = np.array(plot.verts[p0:], dtype="double")
-                            if len(verts):
-                                verts[:,0] -= pos0[0]
-                                verts[:,1] -= pos0[1]
-                                verts = tra0 @ verts.T
 
-                            dpos = tra0 @ (state.pos - pos0)
-                            ret = state.stack[arg0:]
+class _MemoLog:
+    """Memo overlay for `Plot.run_parallel`, new entries are kept aside and
+    every lookup is recorded along with the top-level segment it came from.
+    """
+    def __init__(self, mem, deferred=()):
+        self.mem = mem
+        self.deferred = deferred
+        self.looked = {}
+        self.stored = {}
 
-                            self.mem[key] = (tra, dpos, verts, plot.cmds[p0:], ret)
+    def get(self, key, default=None):
+        seg = len(self.deferred)
+        self.looked[key] = seg
+        entry = self.stored.get(key)
+        if entry is not None:
+            return entry[0]
+        return self.mem.get(key, default)
 
-                case "?":
-                    cond, stmt_end = _args(2)
+    def __setitem__(self, key, value):
+        self.stored[key] = (value, len(self.deferred))
 
-                    if not cond:
-                        ip = stmt_end - 1
 
-                case "P":
-                    _args(1)
+class Program:
+    def __init__(self, code, oparg, consts, jumps, resets, functions):
+        # `None` turns memoization off, a plain dict works as an unbounded cache
+        self.mem = MemoCache()
+        # addresses of functions that are never memoized
+        self.nomemo = set()
+        self.code = code
+        self.oparg = oparg
+        self.consts = consts
+        self.jumps = jumps
+        self.resets = resets
+        self.functions = functions
+        # `(addr, args)` -> extent and effect of a call, for level of detail
+        self.extents = {}
+        self.max_extents = 1 << 16
+        self.debug = False
+        self.max_depth = 10000
 
-                case "b":
-                    break
+    def memoize(self, enabled=True, fn=None):
+        """Turn memoization on or off for the whole program or for function `fn`."""
+        if fn is not None:
+            addr, argc = self.functions[fn]
+            if enabled:
+                self.nomemo.discard(addr)
+            else:
+                self.nomemo.add(addr)
+        elif not enabled:
+            self.mem = None
+        elif self.mem is None:
+            self.mem = MemoCache()
+
+    @property
+    def prog(self):
+        """Token list the bytecode was assembled from."""
+        return [self.token(ip) for ip in range(len(self.code))]
+
+    def token(self, ip):
+        op = self.code[ip]
+        if op >= OP_PUSH:
+            return self.consts[self.oparg[ip]]
+        return OPCODES[op]
 
-                case _:
-                    assert False, self.prog[ip]
+    def _exec(self, plot, state, ip, stack_top, single_statement=False):
+        root = Frame(None, FRAME_ROOT, plot, state, stack_top, single_statement)
+        f = root
+
+        code = self.code
+        oparg = self.oparg
+        consts = self.consts
+        dispatch = self._dispatch
+        enter = self._enter
+        debug = self.debug
+
+        while f is not None:
+            if ip >= len(code):
+                f, ip = self._leave(f, ip)
+                continue
 
-            ip += 1
+            debug and print(f"{self.token(ip):<4} {ip} {f.state.pos}  {f.state.stack}")
 
+            op = code[ip]
+            if op == OP_PUSH:
+                f.state.stack.append(consts[oparg[ip]])
+                ip += 1
+            elif op > OP_LAST_ENTER:
+                ip = dispatch[op](self, f, ip)
+                if plot.size > plot.flush_at:
+                    plot.flush(f)
+            elif op >= OP_ENTER:
+                f, ip = enter[op - OP_ENTER](self, f, ip)
+                if plot.size > plot.flush_at:
+                    plot.flush(f)
+            elif op > OP_STMT_END or f.single_statement:
+                f, ip = self._leave(f, ip)
+                if plot.size > plot.flush_at and f is not None:
+                    plot.flush(f)
+            else:
+                ip += 1
+                if plot.size > plot.flush_at:
+                    plot.flush(f)
+
+        return root.state, ip
+
+    def _resets(self, ip, bit=RESET_STATEMENT):
+        return not 0 <= ip < len(self.resets) or self.resets[ip] & bit
+
+    def _push_frame(self, f, kind, state, single_statement, snapshot, ret=None, data=None, chord=None):
+        if f.depth >= self.max_depth:
+            raise RecursionError(f"maximum frame depth exceeded ({self.max_depth})")
+        return Frame(f, kind, f.plot, state, f.stack_top, single_statement, snapshot, ret, data, chord)
+
+    def _chord(self, f, radius=None):
+        """Record how far the call reached and what it did, and replace its
+        output by a line to its exit point if it all fits in the tolerance.
+
+        `radius` is the call's extent around its entry point before the
+        entry transform, if already known.
+        """
+        plot = f.plot
+        state = f.state
+        mark, (x0, y0), call, (a, b, c, d), arg0 = f.chord
+        hi, lo = _stretch(a, b, c, d)
+        if radius is None:
+            extent = plot.extent(mark, (x0, y0))
+            radius = extent / lo if lo else None
+        else:
+            extent = hi * radius
+
+        if call is not None and radius is not None:
+            # undo the entry transform, so the record holds at any scale
+            det = a * d - b * c
+            a, b, c, d = d / det, -b / det, -c / det, a / det
+            dx, dy = state.x - x0, state.y - y0
+            dpos = (a * dx + b * dy, c * dx + d * dy)
+            tra = (a * state.a + b * state.c, a * state.b + b * state.d,
+                   c * state.a + d * state.c, c * state.b + d * state.d)
+            if len(self.extents) >= self.max_extents:
+                self.extents.clear()
+            self.extents[call] = (radius, tra, dpos, state.stack[arg0:])
+
+        if extent < plot.tolerance:
+            plot.chord(mark, (state.x, state.y))
+
+    def _leave(self, f, ip):
         # print("exec del:", state.stack[stack_top:stack_top + stack_drop], state.stack)
-        del state.stack[stack_top:stack_top + stack_drop]
+        del f.state.stack[f.stack_top:f.stack_top + f.stack_drop]
 
         # print(f"exec {ip}:", state.stack)
-        return state, ip
+        if f.parent is None:
+            return None, ip
+        return self._resume[f.kind](self, f, ip)
+
+    def _enter_combine(self, f, ip):
+        state = f.state
+        data = (state.a, state.b, state.c, state.d)
+        snapshot = self._resets(ip, RESET_CONTEXT)
+        return self._push_frame(f, FRAME_COMBINE, f.state, False, snapshot, data=data), ip + 1
+
+    def _resume_combine(self, f, ip):
+        p = f.parent
+        p.state = f.state
+        p.state.a, p.state.b, p.state.c, p.state.d = f.data
+        return p, ip + 1
+
+    def _enter_isolate(self, f, ip):
+        plot = f.plot
+        # top-level contexts left for `Plot.run_parallel` to run elsewhere
+        if f.parent is None and plot.deferred is not None and self.jumps[ip] >= 0:
+            plot.deferred.append((ip, f.state.clone(), plot.size))
+            plot.floor = plot.size
+            plot.add_point(Path.MOVETO, (f.state.x, f.state.y))
+            return f, self.jumps[ip] + 1
+
+        snapshot = self._resets(ip, RESET_CONTEXT)
+        return self._push_frame(f, FRAME_ISOLATE, f.state.clone(), False, snapshot), ip + 1
+
+    def _resume_isolate(self, f, ip):
+        p = f.parent
+        p.plot.add_point(Path.MOVETO, (p.state.x, p.state.y))
+        return p, ip + 1
+
+    def _enter_discard(self, f, ip):
+        data = f.plot.mark()
+        snapshot = self._resets(ip, RESET_CONTEXT)
+        return self._push_frame(f, FRAME_DISCARD, f.state.clone(), False, snapshot, data=data), ip + 1
+
+    def _resume_discard(self, f, ip):
+        p = f.parent
+        plot = p.plot
+        p.state.x, p.state.y = f.state.x, f.state.y
+        pos = plot.last_point()
+        plot.truncate(*f.data)
+        plot.add_point(Path.MOVETO, pos)
+        return p, ip + 1
+
+    def _enter_loop(self, f, ip):
+        start = ip + 1
+        itr = iter(range(*f.args(1)))
+        n = next(itr, None)
+
+        # nothing to repeat, `:` runs again on what is left on the stack
+        if n is None:
+            return f, ip
+
+        f.state.iteration = n
+        snapshot = self._resets(start)
+        return self._push_frame(f, FRAME_LOOP, f.state, True, snapshot, ret=start, data=itr), start
+
+    def _resume_loop(self, f, ip):
+        p = f.parent
+        p.state = f.state
+        n = next(f.data, None)
+        if n is None:
+            return p, ip
+
+        p.state.iteration = n
+        f.enter(p.state, p.stack_top, True, f.initial_state is not None)
+        return f, f.ret
+
+    def _enter_call(self, f, ip):
+        addr, *_ = f.args(1)
+        snapshot = self._resets(addr)
+        return self._push_frame(f, FRAME_CALL, f.state, True, snapshot, ret=ip + 1), addr
+
+    def _resume_call(self, f, ip):
+        p = f.parent
+        p.state = f.state
+        return p, f.ret
+
+    def _enter_call_memo(self, f, ip):
+        plot = f.plot
+        state = f.state
+        addr, argc = f.args(2)
+        key = (addr, tuple(state.stack[len(state.stack)-argc:]))
+        mem = self.mem if addr not in self.nomemo else None
+        chord = None
+        if plot.tolerance is not None:
+            call = key if addr not in self.nomemo else None
+            extent = self.extents.get(call)
+            if extent is None:
+                chord = (plot.mark(), (state.x, state.y), call, (state.a, state.b, state.c, state.d),
+                         len(state.stack) - argc)
+            elif state.stretch()[0] * extent[0] < plot.tolerance:
+                # the whole call fits in the tolerance, skip it
+                _, tra, dpos, ret = extent
+                plot.add_point(Path.LINETO, state.move(*dpos))
+                plot.chords += 1
+                state.compose(*tra)
+                arg0 = len(state.stack)
+                del state.stack[arg0-argc:arg0]
+                state.stack.extend(ret)
+                return f, ip + 1
+
+            if mem is not None:
+                # chords depend on the output size, keep them apart from exact paths
+                scale = state.scale()
+                key += (plot.tolerance, round(math.log2(scale) * 16) if scale else None)
+        hit = mem.get(key) if mem is not None else None
+
+        if hit is not None:
+            tra, dpos, block, ret = hit
+
+            # for c, p in zip(cmds, verts):
+            #     plot.add_point(c, state.pos + state.transform(p))
+
+            if plot.tolerance is None or not block.size or state.scale() * block.radius >= plot.tolerance:
+                plot.add_block(block, state.transformation_matrix, (state.x, state.y))
+                state.move(*dpos)
+            else:
+                plot.add_point(Path.LINETO, state.move(*dpos))
+                plot.chords += 1
+            state.compose(*tra)
+
+            arg0 = len(state.stack)
+            # print("callm del", state.stack[arg0-argc:arg0], "stack=", state.stack)
+            del state.stack[arg0-argc:arg0]
+            state.stack.extend(ret)
+            return f, ip + 1
+
+        data = None
+        if mem is not None:
+            mark = plot.mark()
+            mat0 = state.transformation_matrix
+            tra0 = np.linalg.inv(mat0)
+            pos0 = state.pos
+            arg0 = len(state.stack) - argc
+            data = (mem, key, mark, mat0, tra0, pos0, arg0)
+
+        snapshot = self._resets(addr)
+        return self._push_frame(f, FRAME_CALL_MEMO, state, True, snapshot, ret=ip + 1, data=data, chord=chord), addr
+
+    def _resume_call_memo(self, f, ip):
+        p = f.parent
+        plot = p.plot
+        state = p.state = f.state
+
+        radius = None
+        if f.data is not None:
+            mem, key, mark, mat0, tra0, pos0, arg0 = f.data
+            tra = (state.transformation_matrix @ tra0).ravel().tolist()
+            block = plot.block(mark, tra0, pos0)
+            dpos = (tra0 @ (state.pos - pos0)).tolist()
+            ret = state.stack[arg0:]
+
+            # while streaming, a memo hit must not add more than a chunk at once
+            if plot.output is None or block.size <= plot.output.chunk:
+                mem[key] = (tra, dpos, block, ret)
+            if plot.viewport is not None:
+                plot.cull(mark, block, mat0, pos0)
+            if f.chord is not None:
+                radius = block.radius
+
+        if f.chord is not None:
+            self._chord(f, radius)
+        return p, f.ret
+
+    def _op_end(self, f, ip):
+        assert False, self.token(ip)
+
+    def _op_token(self, f, ip):
+        assert False, self.token(ip)
+
+    def _op_push(self, f, ip):
+        f.state.stack.append(self.consts[self.oparg[ip]])
+        return ip + 1
+
+    def _op_arg(self, f, ip):
+        arg, = f.args(1)
+        state = f.state
+        if arg:
+            state.stack.append(state.stack[f.stack_top+arg-1])
+        else:
+            state.stack.append(state.iteration)
+        return ip + 1
+
+    def _op_reset(self, f, ip):
+        state = f.state
+        f.state = f.initial_state.clone()
+        f.state.x, f.state.y = state.x, state.y
+        return ip + 1
+
+    def _op_right(self, f, ip):
+        state = f.state
+        f.plot.add_point(Path.LINETO, state.move(1, 0))
+        return ip + 1
+
+    def _op_down(self, f, ip):
+        state = f.state
+        f.plot.add_point(Path.LINETO, state.move(0, -1))
+        return ip + 1
+
+    def _op_left(self, f, ip):
+        state = f.state
+        f.plot.add_point(Path.LINETO, state.move(-1, 0))
+        return ip + 1
+
+    def _op_up(self, f, ip):
+        state = f.state
+        f.plot.add_point(Path.LINETO, state.move(0, 1))
+        return ip + 1
+
+    def _op_skip(self, f, ip):
+        state = f.state
+        f.plot.add_point(Path.MOVETO, state.move(1, 0))
+        return ip + 1
+
+    def _op_move_cur(self, f, ip):
+        f.plot.add_point(PATH_MOVE_CUR, f.plot.last_point())
+        return ip + 1
+
+    def _op_link_last(self, f, ip):
+        if f.plot.last_cmd() == Path.MOVETO:
+            f.plot.add_point(PATH_LINK_LAST, (f.state.x, f.state.y))
+        return ip + 1
+
+    def _op_spline(self, f, ip):
+        plot = f.plot
+        plot.expand_tail(4, f)
+        if plot.floor and plot.size - 4 < plot.floor:
+            raise _Unsplittable("spline across a deferred context")
+        assert plot.size >= 4
+
+        # rewrite the last three points in place
+        path = plot.verts[-4:]
+        p = path[0] + path[2] - path[1]
+        v2 = p - path[3] + path[2]
+
+        path[2] = v2
+        path[3] = p
+        plot.cmds[-3:] = Path.CURVE4
+        f.state.pos = p
+        return ip + 1
+
+    def _op_spline_all(self, f, ip):
+        plot = f.plot
+        begin = 0
+        while self.points[begin - 1][0] == Path.LINETO:
+            begin -= 1
+
+        # Need at least 2 line segments to make a spline
+        if -begin >= 2:
+            curve = self.points[begin:]
+            self.points = self.points[:begin]
+
+            v1 = curve[0][1] - self.points[-1][1]
+            v2 = curve[1][1] - curve[0][1]
+            v = v1 + v2
+
+            plot.add_point(Path.CURVE3, curve[0][1] - 0.25 * v)
+            plot.add_point(Path.CURVE3, curve[0][1])
+
+            for i in range(1, len(curve)-1):
+                plot.add_point(Path.CURVE4, curve[i-1][1] + 0.25 * v)
+                v1 = v2
+                v2 = curve[i+1][1] - curve[i][1]
+                v = v1 + v2
+                plot.add_point(Path.CURVE4, curve[i][1] - 0.25 * v)
+                plot.add_point(Path.CURVE4, curve[i][1])
+
+
+            plot.add_point(Path.CURVE3, curve[-2][1] + 0.25 * v)
+            plot.add_point(Path.CURVE3, curve[-1][1])
+        return ip + 1
+
+    def _op_stretch_x(self, f, ip):
+        f.state.stretch_x(f.args(1)[0])
+        return ip + 1
+
+    def _op_stretch_y(self, f, ip):
+        f.state.stretch_y(f.args(1)[0])
+        return ip + 1
+
+    def _op_zoom(self, f, ip):
+        v, = f.args(1)
+        f.state.stretch_x(v)
+        f.state.stretch_y(v)
+        return ip + 1
+
+    def _op_rotate_cw(self, f, ip):
+        f.state.rotate(-f.args(1)[0])
+        return ip + 1
+
+    def _op_rotate_ccw(self, f, ip):
+        f.state.rotate(f.args(1)[0])
+        return ip + 1
+
+    def _op_reflect_cw(self, f, ip):
+        f.state.rotate(-0.5+f.args(1)[0])
+        return ip + 1
+
+    def _op_reflect_ccw(self, f, ip):
+        f.state.rotate(0.5-f.args(1)[0])
+        return ip + 1
+
+    def _op_shear_x(self, f, ip):
+        f.state.shear_x(f.args(1)[0])
+        return ip + 1
+
+    def _op_shear_y(self, f, ip):
+        f.state.shear_y(f.args(1)[0])
+        return ip + 1
+
+    def _op_add(self, f, ip):
+        lhs, rhs = f.args(2)
+        f.state.stack.append(lhs + rhs)
+        return ip + 1
+
+    def _op_sub(self, f, ip):
+        lhs, rhs = f.args(2)
+        f.state.stack.append(lhs - rhs)
+        return ip + 1
+
+    def _op_mul(self, f, ip):
+        lhs, rhs = f.args(2)
+        f.state.stack.append(lhs * rhs)
+        return ip + 1
+
+    def _op_div(self, f, ip):
+        num, den = f.args(2)
+        f.state.stack.append(num/den)
+        return ip + 1
+
+    def _op_pow(self, f, ip):
+        base, exp = f.args(2)
+        f.state.stack.append(base ** exp)
+        return ip + 1
+
+    def _op_gt(self, f, ip):
+        lhs, rhs = f.args(2)
+        f.state.stack.append(lhs > rhs)
+        return ip + 1
+
+    def _op_enter(self, f, ip):
+        f.stack_drop, *_ = f.args(1)
+        f.stack_top = len(f.state.stack) - f.stack_drop
+        return ip + 1
+
+    def _op_index(self, f, ip):
+        addr, idx = f.args(2)
+        f.state.stack.append(self.token(addr + idx))
+        return ip + 1
+
+    def _op_cond(self, f, ip):
+        cond, = f.args(1)
+
+        if not cond:
+            return self.jumps[ip]
+        return ip + 1
+
+    def _op_target(self, f, ip):
+        return ip + 1
+
+    def _op_pop(self, f, ip):
+        f.args(1)
+        return ip + 1
+
+    _dispatch = [
+        _op_end, _op_end, _op_end, _op_end, _op_end, _op_end,
+        _op_end, _op_end, _op_end, _op_end, _op_end, _op_end,
+        _op_arg, _op_reset,
+        _op_right, _op_down, _op_left, _op_up, _op_skip, _op_move_cur, _op_link_last, _op_spline, _op_spline_all,
+        _op_stretch_x, _op_stretch_y, _op_zoom, _op_rotate_cw, _op_rotate_ccw, _op_reflect_cw, _op_reflect_ccw,
+        _op_shear_x, _op_shear_y, _op_add, _op_sub, _op_mul, _op_div, _op_pow, _op_gt,
+        _op_enter, _op_index, _op_cond, _op_pop,
+        _op_push, _op_token, _op_target,
+    ]
+
+    _enter = [
+        _enter_combine, _enter_isolate, _enter_discard, _enter_loop, _enter_call, _enter_call_memo,
+    ]
+
+    _resume = [
+        None, _resume_combine, _resume_isolate, _resume_discard, _resume_loop, _resume_call, _resume_call_memo,
+    ]
 
 
 class Compiler:
+    # Alternatives are tried in order at each position, same as the original
+    # chain of `re.match` calls, so the token stream is unchanged.
+    _token_re = re.compile(
+        r"(?P<comment>#.*\n)"
+        r'|(?P<string>".*?(?<!\\)")'
+        r"|(?P<sep>,\s*)"
+        r"|(?P<eq>=\s*)"
+        r"|(?P<num>\d*\.?\d+(?:e[+-]?\d+)?)"
+        r"|(?P<ident>\$\d+|\$\w+)"
+        r"|(?P<newline>\n)"
+        r"|(?P<space>\s+)"
+        r"|(?P<char>.)"
+    )
+
     @staticmethod
     def _tokenize(prog):
         tokens = [" "]
-        i = 0
-
-        while i < len(prog):
-            if ident := re.match(r"^#.*\n", prog[i:]):
-                if tokens[-1] != " ":
-                    tokens.append(" ")
-
-                i += ident.end()
 
-            elif string := re.match(r'^".*?(?<!\\)"', prog[i:]):
-                tokens.extend(map(ord, string[0][1:-1]))
-                i += string.end()
+        for m in Compiler._token_re.finditer(prog):
+            kind = m.lastgroup
 
-            elif sep := re.match(r"^,\s*", prog[i:]):
-                i += sep.end()
+            if kind == "char":
+                tokens.append(m[0])
 
-            elif eq := re.match(r"^=\s*", prog[i:]):
-                tokens.append("=")
-                i += eq.end()
+            elif kind == "space" or kind == "comment":
+                if tokens[-1] != " ":
+                    tokens.append(" ")
 
-            elif num := re.match(r"^\d*\.?\d+(e[+-]?\d+)?", prog[i:]):
-                i += num.end()
-                num = num[0]
+            elif kind == "num":
+                num = m[0]
                 if "." in num or "e" in num:
                     num = float(num)
                 else:
                     num = int(num)
                 tokens.append(num)
 
-            elif ident := re.match(r"^\$\d+", prog[i:]):
-                tokens.append(ident[0])
-                i += ident.end()
+            elif kind == "ident" or kind == "newline":
+                tokens.append(m[0])
 
-            elif ident := re.match(r"^\$\w+", prog[i:]):
-                tokens.append(ident[0])
-                i += ident.end()
-
-            elif prog[i] == "\n":
-                tokens.append("\n")
-                i += 1
+            elif kind == "eq":
+                tokens.append("=")
 
-            elif space := re.match(r"^\s+", prog[i:]):
-                if tokens[-1] != " ":
-                    tokens.append(" ")
-                i += space.end()
-
-            else:
-                tokens.append(prog[i])
-                i += 1
+            elif kind == "string":
+                tokens.extend(map(ord, m[0][1:-1]))
 
         tokens.append(" ")
 
         return tokens
 
     @staticmethod
-    def _preprocess(prog):
+    def _statement_ends(prog, starts):
+        """Resolve where the statement beginning at each of `starts` ends.
+
+        A statement ends at the first space on its own nesting level, or at the
+        closing bracket of the enclosing context, whichever comes first.
+        """
+        ends = dict()
+        starts = iter(sorted(starts))
+        start = next(starts, None)
+
+        # one entry per open bracket: statements still waiting for their end
+        pending = [[]]
+
+        for i, c in enumerate(prog):
+            while i == start:
+                pending[-1].append(start)
+                start = next(starts, None)
+
+            if c == " ":
+                for j in pending[-1]:
+                    ends[j] = i
+                pending[-1].clear()
+
+            elif c in ["{", "[", "("]:
+                pending.append([])
+
+            elif c in ["}", "]", ")"]:
+                for j in pending[-1]:
+                    ends[j] = i
+                pending[-1].clear()
+
+                # an unmatched closer keeps using the outermost level
+                if len(pending) > 1:
+                    pending.pop()
+
+        for level in pending:
+            for j in level:
+                ends[j] = len(prog) - 1
+
+        return ends
+
+    @staticmethod
+    def _preprocess(tokens):
         functions = collections.OrderedDict()
         conditionals = list()
         references = list()
@@ -428,91 +927,81 @@ class Compiler:
             "G": operator.gt,
         }
 
+        # Tokens are rewritten into a new list, so `len(prog)` is always the
+        # final address of the next token emitted.
+        prog = [tokens[0]]
+
         i = 1
-        while i < len(prog)-1:
-            # print(f"{i:<3}: {prog[i]:<3} ", prog[i-3:i+3])
+        while i < len(tokens)-1:
+            tok = tokens[i]
+            nxt = tokens[i+1]
 
             # infix
-            if prog[i] in ["+", "-", "*", "/", "p", "G", "@"]:
-                if type(prog[i+1]) in [int, float] and type(prog[i-1]) in [int, float]:
-                    prog[i-1] = operations[prog[i]](prog[i-1], prog[i+1])
-                    del prog[i:i+2]
-                    i -= 1
-                elif type(prog[i+1]) in [int, float]:
-                    prog[i:i+2] = [prog[i+1], prog[i]]
+            if tok in ["+", "-", "*", "/", "p", "G", "@"]:
+                if type(nxt) in [int, float] and type(prog[-1]) in [int, float]:
+                    prog[-1] = operations[tok](prog[-1], nxt)
                     i += 1
-                elif type(prog[i+1]) is str and prog[i+1].startswith("$"):
-                    if prog[i+1][1:].isdigit():
-                        prog[i:i+2] = [int(prog[i+1][1:]), "$", prog[i]]
-                        i += 2
+                elif type(nxt) in [int, float]:
+                    prog += [nxt, tok]
+                    i += 1
+                elif type(nxt) is str and nxt.startswith("$"):
+                    if nxt[1:].isdigit():
+                        prog += [int(nxt[1:]), "$", tok]
                     else:
-                        prog[i:i+2] = [prog[i+1], prog[i]]
-                        references.append(i)
-                        i += 1
-
-            elif prog[i] in ["x", "y", "z", "l", "r", "L", "R"] and type(prog[i+1]) in [int, float]:
-                if type(prog[i-1]) in [int, float]:
-                    prog[i-1] /= prog[i+1]
-                    del prog[i+1]
-                else:
-                    prog[i:i+2] = [1 / prog[i+1], prog[i]]
+                        references.append(len(prog))
+                        prog += [nxt, tok]
                     i += 1
+                else:
+                    prog.append(tok)
 
-            elif type(prog[i]) is str and prog[i].startswith("$"):
-                if prog[i][1:].isdigit():
-                    prog[i] = int(prog[i][1:])
-                    prog.insert(i+1, "$")
-                    i += 1
+            elif tok in ["x", "y", "z", "l", "r", "L", "R"] and type(nxt) in [int, float]:
+                if type(prog[-1]) in [int, float]:
+                    prog[-1] /= nxt
+                    prog.append(tok)
                 else:
-                    references.append(i)
+                    prog += [1 / nxt, tok]
+                i += 1
 
-            elif prog[i] == "=":
-                assert prog[i-1].startswith("$")
-                name = prog[i-1]
+            elif type(tok) is str and tok.startswith("$"):
+                if tok[1:].isdigit():
+                    prog += [int(tok[1:]), "$"]
+                else:
+                    references.append(len(prog))
+                    prog.append(tok)
 
-                del prog[i-1]
-                i -= 1
+            elif tok == "=":
+                assert prog[-1].startswith("$")
+                name = prog.pop()
 
-                if type(prog[i-1]) is int:
-                    argc = prog[i-1]
-                    addr = i-1
+                if type(prog[-1]) is int:
+                    argc = prog[-1]
+                    addr = len(prog) - 1
+                    prog.append(tok)
                 else:
                     argc = 0
-                    addr = i
-
-                    del prog[i]
-                    i -= 1
+                    addr = len(prog)
 
                 functions[name] = (addr, argc)
                 references.pop()
 
-            elif prog[i] == "?":
-                prog.insert(i, None)
-                conditionals.append(i)
-                i += 1
+            elif tok == "?":
+                conditionals.append(len(prog))
+                prog += [None, tok]
 
-            elif prog[i] == "!":
-                if type(prog[i-1]) is str and prog[i-1].startswith("$") and len(prog[i-1]) > 1:
-                    prog[i] = "`"
-                    calls.append(i)
-                    prog.insert(i, None)
-                    i += 1
+            elif tok == "!" and type(prog[-1]) is str and prog[-1].startswith("$") and len(prog[-1]) > 1:
+                calls.append(len(prog))
+                prog += [None, "`"]
+
+            else:
+                prog.append(tok)
 
             i += 1
 
+        prog.append(tokens[-1])
+
+        ends = Compiler._statement_ends(prog, [i+1 for i in conditionals])
         for i in conditionals:
-            level = 0
-            for j, c in enumerate(prog[i+1:], start=i+1):
-                if c == " " and level == 0:
-                    break
-                elif c in ["{", "[", "("]:
-                    level += 1
-                elif c in ["}", "]", ")"]:
-                    level -= 1
-
-                if level < 0:
-                    break
-            prog[i] = j
+            prog[i] = ends[i+1]
 
         for i in calls:
             addr, argc = functions[prog[i-1]]
@@ -526,21 +1015,989 @@ class Compiler:
         return prog, functions
 
     @staticmethod
-    def compile(code):
+    def _assemble(prog):
+        code = array.array("B")
+        oparg = array.array("i")
+        consts = list()
+        pool = dict()
+
+        for i, tok in enumerate(prog):
+            if type(tok) is str and tok in OPCODE:
+                code.append(OPCODE[tok])
+                oparg.append(0)
+            else:
+                # repr keeps 0.0 and -0.0 apart
+                key = (type(tok), repr(tok))
+                if key not in pool:
+                    pool[key] = len(consts)
+                    consts.append(tok)
+
+                if prog[i+1:i+2] == ["?"]:
+                    code.append(OP_TARGET)
+                elif type(tok) in [int, float]:
+                    code.append(OP_PUSH)
+                else:
+                    code.append(OP_TOKEN)
+                oparg.append(pool[key])
+
+        return code, oparg, consts
+
+    @staticmethod
+    def _jump_table(prog):
+        """Resolve jump targets and state snapshots in one scan.
+
+        `jumps` maps each `(` to its `)` and `?` to where it skips to, the
+        places the interpreter jumps over code without running it. `resets`
+        marks statements (RESET_STATEMENT) and bracket contents
+        (RESET_CONTEXT) that may run a `|` of their own and so need a snapshot of the state on entry: a `|`
+        on their level (a `?` may skip a statement past its end), or a `|`
+        anywhere inside together with a `b` that could return to it.
+        """
+        n = len(prog)
+        jumps = array.array("i", [-1]) * n
+        ends = array.array("i", [n]) * n
+        resets = bytearray([RESET_STATEMENT | RESET_CONTEXT]) * n
+
+        # number of `b` and `|` before each address
+        breaks = array.array("i", [0]) * (n + 1)
+        bars = array.array("i", [0]) * (n + 1)
+
+        # one entry per open bracket: opener address, statements waiting for
+        # their end, resolved statements and last `|` on that level
+        levels = [[-1, [], [], -1]]
+
+        def resolve(level, end):
+            for s in level[1]:
+                ends[s] = end
+            level[2].extend(level[1])
+            level[1].clear()
+
+        def close(level):
+            for s in level[2]:
+                e = ends[s]
+                if level[3] < s and not (bars[e] > bars[s] and breaks[e] > breaks[s]):
+                    resets[s] &= ~RESET_STATEMENT
+
+        for i, c in enumerate(prog):
+            breaks[i+1] = breaks[i] + (c == "b")
+            bars[i+1] = bars[i] + (c == "|")
+
+            level = levels[-1]
+            level[1].append(i)
+
+            if c == " " or c == "\n":
+                resolve(level, i)
+
+            elif c in ["{", "[", "("]:
+                levels.append([i, [], [], -1])
+
+            elif c in ["}", "]", ")"]:
+                resolve(level, i)
+
+                # an unmatched closer keeps using the outermost level
+                if len(levels) > 1:
+                    levels.pop()
+                    close(level)
+                    o = level[0]
+                    if prog[o] == "(":
+                        jumps[o] = i
+
+                    if level[3] < 0 and not (bars[i] > bars[o] and breaks[i] > breaks[o]):
+                        resets[o] &= ~RESET_CONTEXT
+
+            elif c == "|":
+                level[3] = i
+
+            elif c == "?":
+                jumps[i] = prog[i-1]
+
+        for level in levels:
+            resolve(level, n)
+            close(level)
+
+        return jumps, resets
+
+    @staticmethod
+    @functools.cache
+    def version():
+        """Hash of this module, compiled programs are only valid for the compiler that produced them."""
+        with open(__file__, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    @staticmethod
+    def _build(code):
         tokens = Compiler._tokenize(code)
         prog, functions = Compiler._preprocess(tokens)
-        return Program(prog, functions)
+        return (*Compiler._assemble(prog), *Compiler._jump_table(prog), functions)
+
+    @staticmethod
+    def compile(code, cache_dir=None):
+        """Compile `code` into a `Program`.
+
+        With `cache_dir`, or the MCESRE_CACHE environment variable, set the
+        compiled tables are kept there, keyed by a hash of the source and the
+        compiler version.
+        """
+        cache_dir = cache_dir or os.environ.get("MCESRE_CACHE")
+        if not cache_dir:
+            return Program(*Compiler._build(code))
+
+        key = hashlib.sha256(f"{Compiler.version()}\0{code}".encode("utf8")).hexdigest()
+        path = os.path.join(cache_dir, f"{key}.pickle")
+
+        # a missing, truncated or foreign entry is rebuilt and overwritten,
+        # whatever unpickling or checking it raises
+        try:
+            with open(path, "rb") as f:
+                tables = pickle.load(f)
+            ops, oparg, _, jumps, resets, _ = tables
+            if not len(ops) == len(oparg) == len(jumps) == len(resets):
+                raise ValueError(f"inconsistent cache entry {path}")
+            return Program(*tables)
+        except Exception:
+            pass
+
+        tables = Compiler._build(code)
+
+        # write under a temporary name so readers never see a partial file
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(tables, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        return Program(*tables)
+
+
+def _transform_box(box, matrix, offset):
+    """Bounding box of `box` (xmin, ymin, xmax, ymax) mapped by `matrix` and `offset`."""
+    x0, y0, x1, y1 = box
+    corners = matrix @ np.array([[x0, x1, x0, x1], [y0, y0, y1, y1]], dtype="double")
+    (xmin, ymin), (xmax, ymax) = corners.min(axis=1), corners.max(axis=1)
+    return xmin + offset[0], ymin + offset[1], xmax + offset[0], ymax + offset[1]
+
+
+def _disjoint(a, b):
+    return a[2] < b[0] or b[2] < a[0] or a[3] < b[1] or b[3] < a[1]
+
+
+def _inside(a, b):
+    return b[0] <= a[0] and a[2] <= b[2] and b[1] <= a[1] and a[3] <= b[3]
+
+
+def _expand(cmds, verts, instances, viewport=None, cache=None):
+    """Splice expanded `instances` into `cmds` and (N,2) `verts`."""
+    if not instances:
+        return cmds, verts
+
+    if cache is None:
+        cache = {}
+    parts = []
+    i = 0
+    for idx, block, matrix, offset in instances:
+        parts.append((cmds[i:idx], verts[i:idx]))
+        parts.append(block.place(matrix, offset, viewport, cache))
+        i = idx
+    parts.append((cmds[i:], verts[i:]))
+
+    return np.concatenate([c for c, _ in parts]), np.concatenate([v for _, v in parts])
+
+
+class Block:
+    """Path emitted by a memoized call, relative to the pen at the call.
+
+    `verts` is 2xN. `instances` are `(index, block, matrix, offset)` entries
+    placing other blocks in front of point `index`, so nested memo hits are
+    only expanded by `flat()`.
+    """
+    __slots__ = ("cmds", "verts", "instances", "size", "_radius", "_bbox")
+
+    def __init__(self, cmds, verts, instances=()):
+        self.cmds = cmds
+        self.verts = verts
+        self.instances = instances
+        self.size = len(cmds) + sum(b.size for _, b, _, _ in instances)
+        self._radius = None
+        self._bbox = None
+
+    @property
+    def radius(self):
+        """Distance of the farthest point from the pen at the call."""
+        if self._radius is None:
+            r = np.hypot(*self.verts).max() if self.verts.shape[1] else 0.0
+            for _, b, matrix, offset in self.instances:
+                r = max(r, math.hypot(*offset) + np.linalg.norm(matrix, 2) * b.radius)
+            self._radius = float(r)
+        return self._radius
+
+    @property
+    def bbox(self):
+        """`(xmin, ymin, xmax, ymax)` of every point, including the pen at the call."""
+        if self._bbox is None:
+            boxes = [(0.0, 0.0, 0.0, 0.0)]
+            if self.verts.shape[1]:
+                (x0, y0), (x1, y1) = self.verts.min(axis=1), self.verts.max(axis=1)
+                boxes.append((x0, y0, x1, y1))
+            for _, b, matrix, offset in self.instances:
+                boxes.append(_transform_box(b.bbox, matrix, offset))
+            x0, y0, x1, y1 = zip(*boxes)
+            self._bbox = (float(min(x0)), float(min(y0)), float(max(x1)), float(max(y1)))
+        return self._bbox
+
+    def head(self, n):
+        """Codes and 2xk vertices of the first `n` points of the expanded path."""
+        parts = []
+        start = 0
+        for idx, b, matrix, offset in self.instances:
+            k = min(n, idx - start)
+            parts.append((self.cmds[start:start+k], self.verts[:,start:start+k]))
+            n -= k
+            if n:
+                cmds, verts = b.head(n)
+                verts = matrix @ verts
+                verts[0,:] += offset[0]
+                verts[1,:] += offset[1]
+                parts.append((cmds, verts))
+                n -= len(cmds)
+            start = idx
+            if not n:
+                break
+        else:
+            k = min(n, len(self.cmds) - start)
+            parts.append((self.cmds[start:start+k], self.verts[:,start:start+k]))
+
+        return np.concatenate([c for c, _ in parts]), np.concatenate([v for _, v in parts], axis=1)
+
+    def tail(self, n):
+        """Codes and 2xk vertices of the last `n` points of the expanded path."""
+        parts = []
+        end = len(self.cmds)
+        for idx, b, matrix, offset in reversed(self.instances):
+            k = min(n, end - idx)
+            parts.append((self.cmds[end-k:end], self.verts[:,end-k:end]))
+            n -= k
+            if n:
+                cmds, verts = b.tail(n)
+                verts = matrix @ verts
+                verts[0,:] += offset[0]
+                verts[1,:] += offset[1]
+                parts.append((cmds, verts))
+                n -= len(cmds)
+            end = idx
+            if not n:
+                break
+        else:
+            k = min(n, end)
+            parts.append((self.cmds[end-k:end], self.verts[:,end-k:end]))
+
+        parts.reverse()
+        return np.concatenate([c for c, _ in parts]), np.concatenate([v for _, v in parts], axis=1)
+
+    @property
+    def nbytes(self):
+        # nested blocks are accounted for by their own memo entries
+        return self.cmds.nbytes + self.verts.nbytes + 100 * len(self.instances)
+
+    def flat(self, cache=None):
+        """Return `(cmds, verts)` with every instance expanded.
+
+        Expansions are not kept on the block, where the memo budget would not
+        see them. `cache` shares them between the blocks placed by one call.
+        """
+        if not self.instances:
+            return self.cmds, self.verts
+        if cache is None:
+            cache = {}
+        flat = cache.get(id(self))
+        if flat is None:
+            cmds, verts = _expand(self.cmds, self.verts.T, self.instances, cache=cache)
+            flat = cache[id(self)] = (cmds, verts.T)
+        return flat
+
+    def place(self, matrix, offset, viewport=None, cache=None):
+        """Return the expanded path transformed by `matrix` and `offset`, verts (N,2).
+
+        Parts lying outside `viewport` shrink to their first point, with the
+        link after it that may turn it into a line from the point before, and
+        after a move to their last three, which a link or spline right after
+        them may still read. Whatever else this draws stays inside their
+        bounding box.
+        """
+        if viewport is not None:
+            box = _transform_box(self.bbox, matrix, offset)
+            if self.size > 5 and _disjoint(box, viewport):
+                head_cmds, head_verts = self.head(2)
+                if head_cmds[1] != PATH_LINK_LAST:
+                    head_cmds, head_verts = head_cmds[:1], head_verts[:,:1]
+                cmds, verts = self.tail(3)
+                cmds = np.concatenate([head_cmds, [Path.MOVETO], cmds[1:]]).astype("int8")
+                verts = matrix @ np.column_stack([head_verts, verts])
+                verts[0,:] += offset[0]
+                verts[1,:] += offset[1]
+                return cmds, verts.T
+
+            if self.instances and not _inside(box, viewport):
+                verts = matrix @ self.verts
+                verts[0,:] += offset[0]
+                verts[1,:] += offset[1]
+                instances = [(idx, b, matrix @ m, matrix @ o + offset) for idx, b, m, o in self.instances]
+                return _expand(self.cmds, verts.T, instances, viewport, cache)
+
+        cmds, verts = self.flat(cache)
+        verts = matrix @ verts
+        verts[0,:] += offset[0]
+        verts[1,:] += offset[1]
+        return cmds, verts.T
+
+
+def _fix_path(codes, verts, copy=False):
+    """Resolve the pseudo codes of a plot buffer into plain `Path` codes.
+
+    Consecutive moves collapse to the last one, `PATH_MOVE_CUR` (whose vertex
+    already is the current point) becomes a move, and `PATH_LINK_LAST` turns
+    the code before it into a line and goes away. `copy` if the arrays are
+    views that must not be written to.
+    """
+    # Only keep last of consecutive moves
+    moves = np.hstack((codes != Path.MOVETO, [True]))
+    d = (np.diff(moves.astype("int")) == 1)
+    moves = np.logical_or(moves[:-1], d)
+    if not moves.all():
+        codes = codes[moves]
+        verts = verts[moves]
+        copy = False
 
+    move_curs = (codes == PATH_MOVE_CUR)
+    links = (codes == PATH_LINK_LAST)
+    if copy and (move_curs.any() or links.any()):
+        codes = codes.copy()
+        verts = verts.copy()
 
-class Plot:
+    codes[move_curs] = Path.MOVETO
+    codes[:-1][links[1:]] = Path.LINETO
+
+    if links.any():
+        nlinks = np.logical_not(links)
+        codes = codes[nlinks]
+        verts = verts[nlinks]
+    return codes, verts
+
+
+class _PathStream:
+    """Applies `get_path`'s fix-ups to a path handed over in pieces and
+    passes the result to `sink` in chunks of at most `chunk` points.
+
+    The last point is held back until the next piece comes, along with any
+    links right before it: whether a point stays or changes depends on the
+    one after it.
+    """
+    def __init__(self, sink, chunk):
+        self.sink = sink
+        self.chunk = chunk
+        self.codes = np.empty(0, dtype="int8")
+        self.verts = np.empty((0, 2), dtype="double")
+        # a path that does not start with a move gets one to its first point
+        self.first = None
+        self.started = False
+
+    def write(self, codes, verts, final=False):
+        codes = np.concatenate((self.codes, codes))
+        verts = np.concatenate((self.verts, verts))
+        if not len(codes):
+            return
+        if self.first is None:
+            self.first = verts[:1].copy()
+
+        n = len(codes)
+        if not final:
+            n -= 1
+            while n and codes[n] == PATH_LINK_LAST:
+                n -= 1
+            self.codes, self.verts = codes[n:].copy(), verts[n:].copy()
+            # the held back point is never a link, so it comes out last
+            out_codes, out_verts = _fix_path(codes[:n + 1], verts[:n + 1])
+            out_codes, out_verts = out_codes[:-1], out_verts[:-1]
+        else:
+            self.codes, self.verts = codes[:0], verts[:0]
+            out_codes, out_verts = _fix_path(codes, verts)
+        if not len(out_codes):
+            return
+
+        if not self.started:
+            self.started = True
+            if out_codes[0] != Path.MOVETO:
+                out_codes = np.hstack([[Path.MOVETO], out_codes])
+                out_verts = np.vstack([self.first, out_verts])
+        for i in range(0, len(out_codes), self.chunk):
+            self.sink(out_codes[i:i + self.chunk], out_verts[i:i + self.chunk])
+
+
+class Sink:
+    """Where `Plot.run` sends the path as it is drawn: called with chunks of
+    `(codes, verts)` as returned by `get_path`, closed once the run is over.
+    """
+    def __call__(self, codes, verts):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemorySink(Sink):
+    """Keeps every chunk, `get_path` joins them."""
     def __init__(self):
+        self.chunks = []
+
+    def __call__(self, codes, verts):
+        self.chunks.append((codes, verts))
+
+    def get_path(self):
+        if not self.chunks:
+            return np.empty(0, dtype="int8"), np.empty((0, 2), dtype="double")
+        return np.concatenate([c for c, _ in self.chunks]), np.concatenate([v for _, v in self.chunks])
+
+
+class SVGSink(Sink):
+    """Writes the path as one SVG `<path>` to the text file `file`.
+
+    Without a `viewbox` (xmin, ymin, width, height) in SVG coordinates, room
+    is left for one and it is filled in from the bounds on `close`, which
+    needs a seekable file. The y axis is flipped to match `show`.
+    """
+    letters = {Path.MOVETO: "M", Path.LINETO: "L", Path.CURVE3: "Q", Path.CURVE4: "C"}
+
+    def __init__(self, file, viewbox=None, precision=3, stroke="black"):
+        self.file = file
+        self.precision = precision
+        # room in the header for a number below 1e15, larger ones get an exponent
+        self.number_width = precision + 18
+        self.number = f"%.{precision}f"
+        self.fmt = f"%s{self.number} {self.number}"
+        self.bounds = [math.inf, math.inf, -math.inf, -math.inf]
+        # control points left in the current curve segment
+        self.pending = 0
+
+        file.write('<svg xmlns="http://www.w3.org/2000/svg" ')
+        self.viewbox_at = None
+        if viewbox is None:
+            self.viewbox_at = file.tell()
+            viewbox = (0, 0, 0, 0)
+        file.write(self._viewbox(viewbox) + ">\n")
+        file.write(f'<path fill="none" stroke="{stroke}" vector-effect="non-scaling-stroke" d="')
+
+    def _viewbox(self, viewbox):
+        numbers = [self.number % v for v in viewbox]
+        numbers = [n if len(n) <= self.number_width else "%.*e" % (self.precision, v) for n, v in zip(numbers, viewbox)]
+        return f'viewBox="{" ".join(numbers)}"'.ljust(4 * self.number_width + 13)
+
+    def __call__(self, codes, verts):
+        drawn = verts[codes != Path.CLOSEPOLY]
+        if len(drawn):
+            lo, hi = drawn.min(axis=0), drawn.max(axis=0)
+            b = self.bounds
+            self.bounds = [min(b[0], lo[0]), min(b[1], lo[1]), max(b[2], hi[0]), max(b[3], hi[1])]
+
+        fmt = self.fmt
+        letters = self.letters
+        pending = self.pending
+        parts = []
+        for code, (x, y) in zip(codes.tolist(), verts.tolist()):
+            if pending:
+                pending -= 1
+                parts.append(fmt % ("", x, -y))
+            elif code == Path.CLOSEPOLY:
+                parts.append("Z")
+            else:
+                pending = 2 if code == Path.CURVE4 else 1 if code == Path.CURVE3 else 0
+                parts.append(fmt % (letters[code], x, -y))
+        self.pending = pending
+        self.file.write(" ".join(parts) + " ")
+
+    def close(self):
+        self.file.write('"/>\n</svg>\n')
+        if self.viewbox_at is not None:
+            xmin, ymin, xmax, ymax = self.bounds
+            if xmin > xmax:
+                xmin = ymin = xmax = ymax = 0
+            end = self.file.tell()
+            self.file.seek(self.viewbox_at)
+            self.file.write(self._viewbox((xmin, -ymax, xmax - xmin, ymax - ymin)))
+            self.file.seek(end)
+
+
+class BinarySink(Sink):
+    """Appends the path to the binary file `file` as packed records of one
+    code and a vertex, readable with `np.fromfile(path, BinarySink.dtype)`.
+    """
+    dtype = np.dtype([("code", "i1"), ("vert", "<f8", 2)])
+
+    def __init__(self, file):
+        self.file = file
+
+    def __call__(self, codes, verts):
+        records = np.empty(len(codes), dtype=self.dtype)
+        records["code"] = codes
+        records["vert"] = verts
+        self.file.write(records.tobytes())
+
+
+# on-disk path: header, `count` int8 codes padded to 8 bytes, then `count`
+# (x, y) pairs of little-endian floats of `vert_size` bytes
+PATH_MAGIC = b"MCESRE\x00\x01"
+PATH_HEADER = np.dtype([("magic", "S8"), ("count", "<u8"), ("vert_size", "u1"), ("reserved", "V15")])
+
+
+def save_path(file, codes, verts, dtype="float64"):
+    """Write `codes` and `verts` to the file name `file` in one go, vertices as `dtype` (float64 or float32)."""
+    dtype = np.dtype(dtype).newbyteorder("<")
+    assert dtype.kind == "f" and dtype.itemsize in (4, 8)
+    n = len(codes)
+    at = PATH_HEADER.itemsize + (n + 7) // 8 * 8
+
+    buf = np.zeros(at + 2 * n * dtype.itemsize, dtype="uint8")
+    header = buf[:PATH_HEADER.itemsize].view(PATH_HEADER)[0]
+    header["magic"] = PATH_MAGIC
+    header["count"] = n
+    header["vert_size"] = dtype.itemsize
+    buf[PATH_HEADER.itemsize:PATH_HEADER.itemsize + n].view("int8")[:] = codes
+    buf[at:].view(dtype).reshape(n, 2)[:] = verts
+
+    with open(file, "wb") as f:
+        f.write(buf.data)
+
+
+def load_path(file, mode="r"):
+    """Map a path written by `save_path`, return `(codes, verts)` as views into the file."""
+    mm = np.memmap(file, dtype="uint8", mode=mode)
+    header = mm[:PATH_HEADER.itemsize].view(PATH_HEADER)[0]
+    if header["magic"] != PATH_MAGIC:
+        raise ValueError(f"{file}: not a saved path")
+    n = int(header["count"])
+    dtype = np.dtype(f"<f{header['vert_size']}")
+    at = PATH_HEADER.itemsize + (n + 7) // 8 * 8
+
+    codes = mm[PATH_HEADER.itemsize:PATH_HEADER.itemsize + n].view("int8")
+    verts = mm[at:at + 2 * n * dtype.itemsize].view(dtype).reshape(n, 2)
+    return codes, verts
+
+
+def _run_index(mask):
+    """Position of every True in `mask` within its run of consecutive Trues."""
+    idx = np.arange(len(mask))
+    starts = np.maximum.accumulate(np.where(mask, 0, idx + 1))
+    return idx - starts
+
+
+# Bernstein to power basis, highest power first
+_POWER_BASIS = {
+    2: np.array([[1, -2, 1], [-2, 2, 0], [1, 0, 0]], dtype="double"),
+    3: np.array([[-1, 3, -3, 1], [3, -6, 3, 0], [-3, 3, 0, 0], [1, 0, 0, 0]], dtype="double"),
+}
+
+
+def flatten(codes, verts, tolerance=0.25, max_steps=1024):
+    """Replace every `CURVE3` and `CURVE4` segment by lines no farther than
+    `tolerance` from the curve.
+
+    Returns `(codes, verts, lengths)`, only moves and lines left, with
+    `lengths[i]` the length of the line ending at point `i` (0 for moves).
+    Each curve gets its own number of lines from the size of its control
+    polygon's second differences (Wang's bound), curves with the same
+    number are evaluated together.
+    """
+    codes = np.asarray(codes)
+    verts = np.asarray(verts, dtype="double")
+    counts = np.ones(len(codes), dtype="intp")
+    lines = np.zeros(len(codes), dtype="bool")
+    curves = []
+    for code, degree in [(Path.CURVE3, 2), (Path.CURVE4, 3)]:
+        mask = codes == code
+        if not mask.any():
+            continue
+        # a segment starts at the point before its first control point
+        first = np.flatnonzero(mask & (_run_index(mask) % degree == 0))
+        first = first[(first > 0) & (first + degree <= len(codes))]
+        ctrl = verts[first[:, None] + np.arange(-1, degree)]
+
+        dd = np.hypot(*(ctrl[:, :-2] - 2 * ctrl[:, 1:-1] + ctrl[:, 2:]).transpose(2, 0, 1)).max(axis=1)
+        steps = np.ceil(np.sqrt(degree * (degree - 1) / 8 * dd / tolerance))
+        steps = np.clip(steps, 1, max_steps).astype("intp")
+
+        counts[mask] = 0
+        counts[first] = steps
+        lines[first] = True
+        curves.append((first, ctrl, steps))
+
+    if curves:
+        at = np.cumsum(counts) - counts
+        out_codes = np.repeat(np.where(lines, Path.LINETO, codes), counts).astype(codes.dtype)
+        out_verts = np.repeat(verts, counts, axis=0)
+
+        for first, ctrl, steps in curves:
+            degree = ctrl.shape[1] - 1
+            coef = _POWER_BASIS[degree] @ ctrl
+            # curves split into the same number of lines share their powers of t
+            for n in np.unique(steps):
+                sel = np.flatnonzero(steps == n)
+                t = np.arange(1, n + 1) / n
+                pts = (t[:, None] ** np.arange(degree, -1, -1)) @ coef[sel]
+                out_verts[(at[first[sel], None] + np.arange(n)).ravel()] = pts.reshape(-1, 2)
+            # end points exactly where they were
+            out_verts[at[first] + steps - 1] = ctrl[:, -1]
+        codes, verts = out_codes, out_verts
+
+    lengths = np.zeros(len(codes), dtype="double")
+    if len(codes) > 1:
+        d = np.diff(verts, axis=0)
+        lengths[1:] = np.where(codes[1:] == Path.LINETO, np.hypot(d[:, 0], d[:, 1]), 0)
+    return codes, verts, lengths
+
+
+def merge_collinear(codes, verts):
+    """Drop every line end that continues straight on into the next line.
+
+    Exact: a point goes only if the cross product of its two lines is zero
+    and it goes on forwards, both along the lines it joins and between the
+    points kept around it, so the drawn path is the same. Zero length lines
+    are kept.
+    """
+    n = len(codes)
+    if n < 3:
+        return codes, verts
+
+    def straight(a, b):
+        cross = a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]
+        dot = a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1]
+        return (cross == 0) & (dot > 0)
+
+    d = np.diff(verts, axis=0)
+    drop = (codes[1:-1] == Path.LINETO) & (codes[2:] == Path.LINETO) & straight(d[:-1], d[1:])
+    # rounding can bend a run of straight joins, check against the kept points until none is put back
+    index = np.arange(n)
+    while drop.any():
+        keep = np.hstack([[True], ~drop, [True]])
+        prev = np.maximum.accumulate(np.where(keep, index, 0))
+        next = np.minimum.accumulate(np.where(keep, index, n - 1)[::-1])[::-1]
+        i = np.flatnonzero(~keep)
+        bent = ~straight(verts[i] - verts[prev[i]], verts[next[i]] - verts[i])
+        if not bent.any():
+            return codes[keep], verts[keep]
+        drop[i[bent] - 1] = False
+    return codes, verts
+
+
+def simplify(codes, verts, tolerance):
+    """Ramer-Douglas-Peucker on every run of lines, to within `tolerance`.
+
+    Moves and curves are kept and split the runs. All runs are worked on
+    together, one split per run and pass.
+    """
+    n = len(codes)
+    lines = codes == Path.LINETO
+    if n < 3 or not lines.any():
+        return codes, verts
+
+    # a run goes from the point before its first line to its last line
+    starts = np.flatnonzero(lines[1:] & ~lines[:-1])
+    ends = np.flatnonzero(lines & ~np.hstack([lines[1:], [False]]))
+    if lines[0]:
+        ends = ends[1:]
+    keep = ~lines
+    keep[ends] = True
+    ranges = np.stack([starts, ends], axis=1)
+    x, y = verts[:, 0].copy(), verts[:, 1].copy()
+
+    while len(ranges):
+        ranges = ranges[ranges[:, 1] - ranges[:, 0] > 1]
+        if not len(ranges):
+            break
+        s, e = ranges[:, 0], ranges[:, 1]
+        count = e - s - 1
+        first = np.cumsum(count) - count
+        seg = np.repeat(np.arange(len(ranges)), count)
+        idx = np.arange(len(seg)) - np.repeat(first - s - 1, count)
+
+        # distance to the chord, per run constants spread over its points
+        x0, y0 = x[s], y[s]
+        vx, vy = x[e] - x0, y[e] - y0
+        vv = vx * vx + vy * vy
+        vv = np.repeat(np.where(vv > 0, vv, 1), count)
+        x0, y0, vx, vy = (np.repeat(a, count) for a in (x0, y0, vx, vy))
+        wx, wy = x[idx] - x0, y[idx] - y0
+        t = np.clip((wx * vx + wy * vy) / vv, 0, 1)
+        dist = np.hypot(wx - t * vx, wy - t * vy)
+
+        worst = np.maximum.reduceat(dist, first)
+        split = worst > tolerance
+        if not split.any():
+            break
+        # the first farthest point of every run that needs splitting
+        hit = dist == worst[seg]
+        hit &= split[seg]
+        at = np.flatnonzero(hit)
+        at = at[np.hstack([[True], seg[at][1:] != seg[at][:-1]])]
+        m = idx[at]
+        keep[m] = True
+
+        r = seg[at]
+        ranges = np.vstack([np.stack([s[r], m], axis=1), np.stack([m, e[r]], axis=1)])
+
+    return codes[keep], verts[keep]
+
+
+def rasterize(codes, verts, size=(800, 600), limits=None, batch=1 << 22):
+    """Draw a path as 1 pixel white lines on black, return a (height, width) uint8 image.
+
+    `limits` ((xmin, xmax), (ymin, ymax)) are fitted into the image keeping
+    the aspect ratio, like `show` does, and default to the path bounds.
+    Curves are flattened first.
+    """
+    width, height = size
+    image = np.zeros((height, width), dtype="uint8")
+    verts = np.asarray(verts, dtype="double")
+    if len(verts) < 2:
+        return image
+
+    if limits is None:
+        limits = (verts[:,0].min(), verts[:,0].max()), (verts[:,1].min(), verts[:,1].max())
+    (xmin, xmax), (ymin, ymax) = limits
+    s = min((width - 1) / max(xmax - xmin, 1e-300), (height - 1) / max(ymax - ymin, 1e-300))
+    # a quarter pixel off the curve is not visible
+    codes, verts, _ = flatten(codes, verts, 0.25 / s)
+    px = (verts[:,0] - (xmin + xmax) / 2) * s + (width - 1) / 2
+    py = (height - 1) / 2 - (verts[:,1] - (ymin + ymax) / 2) * s
+
+    # one segment per line, sampled once per pixel along its longer axis
+    seg = np.flatnonzero(codes[1:] == Path.LINETO)
+    x0, y0 = px[seg], py[seg]
+    dx, dy = px[seg + 1] - x0, py[seg + 1] - y0
+
+    # clip to the pixels (Liang-Barsky), only the part of a line inside is sampled
+    p = np.stack([-dx, dx, -dy, dy])
+    q = np.stack([x0 + 0.5, width - 0.5 - x0, y0 + 0.5, height - 0.5 - y0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = q / p
+    t0 = np.where(p < 0, r, 0).max(axis=0)
+    t1 = np.where(p > 0, r, 1).min(axis=0)
+    shown = (t0 <= t1) & ~((p == 0) & (q < 0)).any(axis=0)
+    x0, y0, dx, dy, t0, t1 = x0[shown], y0[shown], dx[shown], dy[shown], t0[shown], t1[shown]
+    seg = seg[shown]
+    x0, y0 = x0 + t0 * dx, y0 + t0 * dy
+    dx, dy = dx * (t1 - t0), dy * (t1 - t0)
+    n = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype("intp") + 1
+
+    ends = np.cumsum(n)
+    lo = 0
+    while lo < len(seg):
+        hi = max(int(np.searchsorted(ends, ends[lo] - n[lo] + batch, side="right")), lo + 1)
+        nb = n[lo:hi]
+        idx = np.repeat(np.arange(lo, hi), nb)
+        k = np.arange(len(idx)) - np.repeat(np.cumsum(nb) - nb, nb)
+        t = k / np.maximum(n[idx] - 1, 1)
+        xs = np.rint(x0[idx] + dx[idx] * t).astype("intp")
+        ys = np.rint(y0[idx] + dy[idx] * t).astype("intp")
+        keep = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        image[ys[keep], xs[keep]] = 255
+        lo = hi
+    return image
+
+
+def write_png(file, image):
+    """Write a (height, width) uint8 grayscale image to the file name `file` as PNG."""
+    height, width = image.shape
+    raw = np.zeros((height, width + 1), dtype="uint8")
+    raw[:, 1:] = image
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    with open(file, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def _stretch(a, b, c, d):
+    """Singular values of the linear map `a b / c d`, largest first."""
+    f = a * a + b * b + c * c + d * d
+    det = abs(a * d - b * c)
+    hi = math.sqrt((f + math.sqrt(max(f * f - 4 * det * det, 0.0))) / 2)
+    return hi, det / hi if hi else 0.0
+
+
+def _held_marks(f):
+    """Plot marks an open frame may still truncate or read back to."""
+    if f.chord is not None:
+        yield f.chord[0]
+    if f.kind == FRAME_DISCARD:
+        yield f.data
+    elif f.kind == FRAME_CALL_MEMO and f.data is not None:
+        yield f.data[2]
+
+
+def _move_marks(f, move):
+    """Replace every mark `(n, k)` held by `f` and its parents by `move(n, k)`."""
+    while f is not None:
+        if f.chord is not None:
+            mark, *rest = f.chord
+            f.chord = (move(*mark), *rest)
+        if f.kind == FRAME_DISCARD:
+            f.data = move(*f.data)
+        elif f.kind == FRAME_CALL_MEMO and f.data is not None:
+            mem, key, mark, *rest = f.data
+            f.data = (mem, key, move(*mark), *rest)
+        f = f.parent
+
+
+def _rebase(f, n, k):
+    """Move the marks held by `f` and its parents down by `n` points and `k` instances."""
+    _move_marks(f, lambda m, mk: (m - n, mk - k))
+
+
+def _memo_order(log, logs):
+    """Return the memo entries of a parallel run in serial order.
+
+    `log` is the top level, split in segments by the contexts it skipped,
+    `logs` holds the (lookups, entries) of each context. Raises
+    `_Unsplittable` if a lookup could have found an entry from a context
+    serially before it, or one from the top level serially after it.
+    """
+    first = {}
+    for i, (_, stored) in enumerate(logs):
+        for key in stored:
+            first.setdefault(key, i)
+
+    for key, seg in log.looked.items():
+        if first.get(key, seg) < seg:
+            raise _Unsplittable("memo entry shared with a context")
+    for i, (looked, _) in enumerate(logs):
+        for key in looked:
+            entry = log.stored.get(key)
+            if first.get(key, i) < i or entry is not None and entry[1] > i:
+                raise _Unsplittable("memo entry shared between contexts")
+
+    segments = [[] for _ in range(len(logs) + 1)]
+    for key, (value, seg) in log.stored.items():
+        segments[seg].append((key, value))
+    stores = []
+    for i, seg in enumerate(segments):
+        stores += seg
+        if i < len(logs):
+            stores += logs[i][1].items()
+
+    # serially, eviction would change what later lookups find
+    entry_size = getattr(log.mem, "entry_size", None)
+    if entry_size is not None and log.mem.bytes + sum(entry_size(k, v) for k, v in stores) > log.mem.max_bytes:
+        raise _Unsplittable("memo budget exceeded")
+    return stores
+
+
+# what `Plot.run_parallel` and `Plot.sweep` hand to their forked workers
+_worker_program = None
+_worker_plot = None
+
+
+def _fork_pool(workers, prog, plot=None):
+    """Return a process pool whose workers start from `prog` and `plot` as they are now."""
+    return concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"),
+                                                  initializer=_init_worker, initargs=(prog, plot))
+
+
+def _init_worker(prog, plot):
+    global _worker_program, _worker_plot
+    _worker_program, _worker_plot = prog, plot
+
+
+def _run_sweep(fn, args, kwargs):
+    """Run `fn` with `args` on a copy of the worker's plot."""
+    plot = _worker_plot.copy()
+    plot.run(_worker_program, fn, *args, **kwargs)
+    codes, verts = plot.get_path()
+    return args, np.array(codes), np.array(verts)
+
+
+def _run_deferred(job):
+    """Run one context skipped by `Plot.run_parallel`, after the last points before it."""
+    ip, state, cmds, verts = job
+    prog = _worker_program
+    mem = prog.mem
+    log = None if mem is None else _MemoLog(mem)
+    prog.mem = log
+
+    plot = Plot()
+    plot.size = 0
+    plot.add_points(cmds, verts)
+    plot.state = state
+    try:
+        _, end = prog._exec(plot, state, ip + 1, 0)
+    finally:
+        prog.mem = mem
+
+    n = len(cmds)
+    seeded = (plot.size >= n and not plot.instances
+              and plot.cmds[:n].tobytes() == cmds.tobytes() and plot.verts[:n].tobytes() == verts.tobytes())
+    looked = () if log is None else set(log.looked)
+    stored = {} if log is None else {k: v for k, (v, _) in log.stored.items()}
+    return end, plot.cmds[n:].copy(), plot.verts[n:].copy(), seeded, looked, stored
+
+
+class Plot:
+    def __init__(self, instanced=False):
+        # memo hits are kept as references to their `Block` until `get_path`
+        self.instanced = instanced
+        # set by `run`, calls and contexts smaller than this are drawn as chords
+        self.tolerance = None
+        # (xmin, ymin, xmax, ymax) the output is meant for, memo hits outside
+        # it are kept as instances and dropped by `get_path`
+        self.viewport = None
+        # set by `run_parallel`: top-level contexts are recorded here instead of
+        # being run, and nothing may read back past `floor`
+        self.deferred = None
+        self.floor = 0
+        # set by `run` with a sink: points are handed over once past `flush_at`
+        self.output = None
+        self.flush_at = sys.maxsize
         self.reset()
 
     def reset(self, reset_pos=True):
         self.state = State()
 
-        self.verts = [self.state.pos]
-        self.cmds = [Path.MOVETO]
+        # path buffers grow geometrically, only the first `size` rows are used
+        self.size = 0
+        self.instances = []
+        self.chords = 0
+        self.code_buf = np.empty(1024, dtype="int8")
+        self.vert_buf = np.empty((1024, 2), dtype="double")
+        self.add_point(Path.MOVETO, (self.state.x, self.state.y))
+
+    @property
+    def verts(self):
+        """View of the vertices emitted so far."""
+        return self.vert_buf[:self.size]
+
+    @property
+    def cmds(self):
+        """View of the path codes emitted so far."""
+        return self.code_buf[:self.size]
+
+    def reserve(self, n):
+        """Make room for `n` more points."""
+        need = self.size + n
+        if need > len(self.code_buf):
+            cap = max(need, 2 * len(self.code_buf))
+            code_buf = np.empty(cap, dtype="int8")
+            vert_buf = np.empty((cap, 2), dtype="double")
+            code_buf[:self.size] = self.cmds
+            vert_buf[:self.size] = self.verts
+            self.code_buf = code_buf
+            self.vert_buf = vert_buf
 
     def condense_path(self, path):
         r = P(0, 0)
@@ -549,10 +2006,130 @@ class Plot:
         return r
 
     def add_point(self, cmd, point):
-        self.verts.append(point)
-        self.cmds.append(cmd)
+        n = self.size
+        if n == len(self.code_buf):
+            self.reserve(1)
+        self.code_buf[n] = cmd
+        vert_buf = self.vert_buf
+        vert_buf[n, 0], vert_buf[n, 1] = point
+        self.size = n + 1
+
+    def add_points(self, cmds, verts):
+        """Append a block of codes and an (N,2) array of vertices."""
+        n = self.size
+        self.reserve(len(cmds))
+        self.code_buf[n:n + len(cmds)] = cmds
+        self.vert_buf[n:n + len(cmds)] = verts
+        self.size = n + len(cmds)
+
+    def add_block(self, block, matrix, offset):
+        """Append a memoized block transformed by `matrix` and `offset`."""
+        if not block.size:
+            return
+        # with a viewport blocks stay nested, so get_path can cull at every level
+        if self.instanced or self.viewport is not None:
+            self.instances.append((self.size, block, matrix, offset))
+        else:
+            self.add_points(*block.place(matrix, offset))
+
+    def cull(self, mark, block, matrix, offset):
+        """Replace what was emitted since `mark` by an instance of `block` if it is outside the viewport."""
+        if block.size and _disjoint(_transform_box(block.bbox, matrix, offset), self.viewport):
+            self.truncate(*mark)
+            self.instances.append((self.size, block, matrix, offset))
+
+    def block(self, mark, matrix, origin):
+        """Return everything emitted since `mark` as a `Block`, mapped by `matrix` around `origin`."""
+        n, k = mark
+        verts = np.array(self.verts[n:], dtype="double")
+        if len(verts):
+            verts[:,0] -= origin[0]
+            verts[:,1] -= origin[1]
+        verts = matrix @ verts.T
+
+        instances = [(idx - n, b, matrix @ m, matrix @ (np.asarray(o) - origin))
+                     for idx, b, m, o in self.instances[k:]]
+        return Block(self.cmds[n:].copy(), verts, instances)
+
+    def mark(self):
+        return self.size, len(self.instances)
+
+    def truncate(self, n, k=None):
+        """Drop every point from index `n` on, and every instance from `k` on."""
+        self.size = min(self.size, n)
+        if k is not None:
+            del self.instances[k:]
+
+    def extent(self, mark, origin):
+        """Distance from `origin` of the farthest point emitted since `mark`."""
+        n, k = mark
+        r = 0.0
+        if n < self.size:
+            verts = self.verts[n:]
+            r = np.hypot(verts[:,0] - origin[0], verts[:,1] - origin[1]).max()
+        for _, b, matrix, offset in self.instances[k:]:
+            d = math.hypot(offset[0] - origin[0], offset[1] - origin[1])
+            r = max(r, d + np.linalg.norm(matrix, 2) * b.radius)
+        return r
 
-    def run(self, prog, fn=None, *args):
+    def chord(self, mark, pos):
+        """Replace everything emitted since `mark` by a line to `pos`."""
+        if mark != self.mark():
+            self.truncate(*mark)
+            self.add_point(Path.LINETO, pos)
+            self.chords += 1
+
+    def expand_tail(self, n, f=None):
+        """Expand instances until the last `n` points are in the buffers.
+
+        Marks held by the open frame `f` and its parents past an expanded
+        instance move up by the points it put in.
+        """
+        while self.instances and self.instances[-1][0] > self.size - n:
+            idx, block, matrix, offset = self.instances.pop()
+            i = len(self.instances)
+            cmds = self.cmds[idx:].copy()
+            verts = self.verts[idx:].copy()
+            self.size = idx
+            self.add_points(*block.place(matrix, offset))
+            added = self.size - idx
+            self.add_points(cmds, verts)
+            _move_marks(f, lambda m, mk: (m + added, mk - 1) if mk > i else (m, mk))
+
+    def last_point(self):
+        if self.instances and self.instances[-1][0] == self.size:
+            _, block, matrix, offset = self.instances[-1]
+            _, verts = block.tail(1)
+            return (matrix @ verts[:,-1] + offset).tolist()
+        return self.verts[-1].tolist()
+
+    def last_cmd(self):
+        if self.instances and self.instances[-1][0] == self.size:
+            return self.instances[-1][1].tail(1)[0][-1]
+        return self.code_buf[self.size - 1]
+
+    def run(self, prog, fn=None, *args, memoize=True, tolerance=None, viewport=None, sink=None, chunk=1 << 16):
+        """Run `prog`, or its function `fn` with `args`, and return the stack.
+
+        With a `tolerance` in output units, calls whose whole path stays
+        within that distance of their entry point are drawn as one line from
+        entry to exit. Once a call with the same arguments has been drawn, its
+        extent is known on entry and the call is skipped outright when small
+        enough at the current scale.
+
+        With a `viewport` (xmin, ymin, xmax, ymax), memoized calls whose
+        bounding box falls outside it only move the pen.
+
+        With a `sink` (any callable, see `Sink`), the path goes to
+        `sink(codes, verts)` in chunks of at most `chunk` points as it is
+        drawn, fixed up as by `get_path`, and the plot is left with a move to
+        the last point. Points are only held back
+        while a `{`, a memoized call or a level-of-detail check around them is
+        still open. Memoized calls that draw more than a chunk are not
+        recorded, so the buffers stay within a few chunks. Drawn again instead
+        of replayed, they can differ from an unstreamed run in the last bits,
+        and with a `viewport` in how culled parts are cut short.
+        """
         ip = 0
         if fn is not None:
             ip, argc = prog.functions[fn]
@@ -560,39 +2137,236 @@ class Plot:
 
         self.state.stack = list(args)
 
-        # if not memoize:
-        #     self.mem = None
-        # elif memoize and not self.mem:
-        #     self.mem = dict()
+        mem = prog.mem
+        if not memoize:
+            prog.mem = None
+        self.tolerance = tolerance
+        self.viewport = viewport
+        if sink is not None:
+            self.output = _PathStream(sink, chunk)
+            self.flush_at = self.size + chunk
+        try:
+            prog._exec(self, self.state, ip, 0, single_statement=bool(ip))
+            if sink is not None:
+                self.flush(final=True)
+        finally:
+            prog.mem = mem
+            self.tolerance = None
+            self.output = None
+            self.flush_at = sys.maxsize
+        return self.state.stack
 
-        prog._exec(self, self.state, ip, 0, single_statement=bool(ip))
+    def stream(self, prog, fn=None, *args, chunk=1 << 16, **kwargs):
+        """Run like `run` in a background thread, yielding `(codes, verts)`
+        chunks as they are drawn.
+
+        At most two chunks wait for the consumer. Closing the generator stops
+        the run.
+        """
+        chunks = queue.Queue(2)
+        stop = threading.Event()
+        done = object()
+
+        def sink(codes, verts):
+            while not stop.is_set():
+                try:
+                    chunks.put((codes, verts), timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+            raise _Cancelled()
+
+        def produce():
+            try:
+                self.run(prog, fn, *args, sink=sink, chunk=chunk, **kwargs)
+                chunks.put(done)
+            except _Cancelled:
+                pass
+            except BaseException as e:
+                chunks.put(e)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while (item := chunks.get()) is not done:
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    def flush(self, f=None, final=False):
+        """Hand the points no open frame can change any more to the stream.
+
+        `f` is the innermost open frame, whose marks and its parents' are
+        moved down along with the points left in the buffers. A `final` flush
+        hands over everything.
+        """
+        n = self.size
+        k = len(self.instances)
+        if not final:
+            # a spline rewrites the last three points, a `{` reads the one before its mark
+            n -= 4
+            g = f
+            while g is not None:
+                # a call drawing more than a chunk is not worth keeping whole for the memo
+                if g.kind == FRAME_CALL_MEMO and g.data is not None and self.size - g.data[2][0] > self.output.chunk:
+                    g.data = None
+                # nor is a call that already reached out of the tolerance worth a chord
+                if (g.chord is not None and self.size - g.chord[0][0] > self.output.chunk
+                        and self.extent(*g.chord[:2]) >= self.tolerance):
+                    g.chord = None
+                for m, mk in _held_marks(g):
+                    n = min(n, m - 1)
+                    k = min(k, mk)
+                g = g.parent
+            n = max(n, 0)
+            while k and self.instances[k - 1][0] >= n:
+                k -= 1
+
+        last = self.last_point() if final else None
+        if n or k:
+            self.output.write(*_expand(self.cmds[:n], self.verts[:n], self.instances[:k], self.viewport), final)
+        elif final:
+            self.output.write(self.cmds[:0], self.verts[:0], final)
+
+        if final:
+            self.size = 0
+            self.instances = []
+            self.add_point(Path.MOVETO, last)
+            return
+
+        rest = self.size - n
+        self.code_buf[:rest] = self.code_buf[n:self.size]
+        self.vert_buf[:rest] = self.vert_buf[n:self.size]
+        self.size = rest
+        self.instances = [(idx - n, b, m, o) for idx, b, m, o in self.instances[k:]]
+        _rebase(f, n, k)
+        self.flush_at = self.size + self.output.chunk
+
+    def run_parallel(self, prog, workers=None):
+        """Run `prog` like `run`, with top-level `(...)` contexts spread over
+        `workers` processes.
+
+        The top level runs here first with every context skipped, which gives
+        the state each one starts from. The contexts then run against the same
+        program in forked workers and their output is spliced back in order.
+        Whenever the result could differ from a serial run (a memo entry shared
+        between contexts, a context left with `b`, a spline reaching across
+        one, a memo budget that would overflow, or any error on the way) the
+        plot is rolled back and run serially instead.
+        """
+        if "fork" not in multiprocessing.get_all_start_methods() or self.instanced or self.instances:
+            return self.run(prog)
+
+        saved = self.cmds.copy(), self.verts.copy(), self.state.clone(), self.chords
+        self.state.stack = []
+        self.tolerance = self.viewport = None
+
+        mem = prog.mem
+        deferred = self.deferred = []
+        log = None if mem is None else _MemoLog(mem, deferred)
+        prog.mem = log
+        try:
+            prog._exec(self, self.state, 0, 0)
+            if len(deferred) < 2:
+                raise _Unsplittable("nothing to split")
+
+            jobs = [(ip, state, self.cmds[max(mark - 4, 0):mark].copy(), self.verts[max(mark - 4, 0):mark].copy())
+                    for ip, state, mark in deferred]
+            with _fork_pool(workers, prog) as pool:
+                results = list(pool.map(_run_deferred, jobs))
+
+            for (ip, _, _), (end, _, _, seeded, _, _) in zip(deferred, results):
+                if end != prog.jumps[ip] or not seeded:
+                    raise _Unsplittable("context does not end at its `)`")
+            if log is not None:
+                stores = _memo_order(log, [(looked, stored) for *_, looked, stored in results])
+        except Exception:
+            # a `b` or `)` leaving a context early can make the skipped top level
+            # go astray, whatever went wrong the serial run decides
+            results = None
+        finally:
+            prog.mem = mem
+            self.deferred = None
+            self.floor = 0
+
+        if results is None:
+            cmds, verts, self.state, self.chords = saved
+            self.size = 0
+            self.add_points(cmds, verts)
+            return self.run(prog)
+
+        if log is not None:
+            for key, value in stores:
+                mem[key] = value
+
+        # each context goes in front of the move its skip left behind
+        cmds, verts = [], []
+        prev = 0
+        for (_, _, mark), (_, ctx_cmds, ctx_verts, *_) in zip(deferred, results):
+            cmds += [self.cmds[prev:mark], ctx_cmds]
+            verts += [self.verts[prev:mark], ctx_verts]
+            prev = mark
+        cmds.append(self.cmds[prev:])
+        verts.append(self.verts[prev:])
+        cmds, verts = np.concatenate(cmds), np.concatenate(verts)
+        self.size = 0
+        self.add_points(cmds, verts)
         return self.state.stack
 
+    def sweep(self, prog, fn, arglist, workers=None, **kwargs):
+        """Yield `(args, codes, verts)` for `fn` run with each tuple in
+        `arglist`, in the order the runs finish.
+
+        Every run starts from a copy of this plot, on one of `workers` forked
+        processes that share `prog` as compiled and its memo as warm as it is
+        now. Keyword arguments go to `run`.
+        """
+        arglist = [tuple(args) for args in arglist]
+        if "fork" not in multiprocessing.get_all_start_methods():
+            for args in arglist:
+                plot = self.copy()
+                plot.run(prog, fn, *args, **kwargs)
+                yield (args, *plot.get_path())
+            return
+
+        pool = _fork_pool(workers, prog, self)
+        try:
+            futures = [pool.submit(_run_sweep, fn, args, kwargs) for args in arglist]
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def copy(self):
+        """Return a plot with the same pen state and path, sharing nothing with this one."""
+        plot = Plot(self.instanced)
+        plot.state = self.state.clone()
+        plot.size = 0
+        plot.add_points(self.cmds, self.verts)
+        plot.instances = list(self.instances)
+        plot.chords = self.chords
+        return plot
+
     def run_code(self, prog, *args):
         return self.run(Compiler.compile(prog), *args)
 
-    def get_path(self):
-        t0 = time.time()
-        codes = np.array(self.cmds, dtype="int")
-        verts = np.array(self.verts, dtype="double")
+    def get_path(self, merge=False, tolerance=None):
+        """Return `(codes, verts)` ready for `matplotlib.path.Path`.
 
-        # Only keep last of consecutive moves
-        moves = np.hstack((codes != Path.MOVETO, [True]))
-        d = (np.diff(moves.astype("int")) == 1)
-        moves = np.logical_or(moves[:-1], d)
-        codes = codes[moves]
-        verts = verts[moves]
+        Instances are expanded here. When there are none and no fix-up is
+        needed these are views into the plot buffers, valid until the plot is
+        run again.
 
-        move_curs = (codes == PATH_MOVE_CUR)
-        codes[move_curs] = Path.MOVETO
-        verts[1:][move_curs[1:]] = verts[:-1][move_curs[:-1]]
+        `merge` joins straight runs of lines exactly (`merge_collinear`), a
+        `tolerance` simplifies them further (`simplify`).
+        """
+        t0 = time.time()
+        codes, verts = _expand(self.cmds, self.verts, self.instances, self.viewport)
 
-        links = (codes == PATH_LINK_LAST)
-        codes[:-1][links[1:]] = Path.LINETO
-
-        nlinks = np.logical_not(links)
-        codes = codes[nlinks]
-        verts = verts[nlinks]
+        codes, verts = _fix_path(codes, verts, codes.base is self.code_buf)
 
         if codes[0] != Path.MOVETO:
             codes = np.hstack([[Path.MOVETO], codes])
@@ -600,19 +2374,19 @@ class Plot:
 
         assert len(codes) == len(verts)
 
+        if merge:
+            codes, verts = merge_collinear(codes, verts)
+        if tolerance is not None:
+            codes, verts = simplify(codes, verts, tolerance)
+
         # print(f"gen time: {time.time() - t0:.2f} points: {len(codes)}")
         return codes, verts
 
-    def show(self, scale=1):
-        codes, verts = self.get_path()
-
-        # t0 = time.time()
-
-        fig, ax = plt.subplots(figsize=(8*scale, 6*scale))
-        pp1 = mpatches.PathPatch(Path(verts, codes), zorder=2, fill=False)
-
-        ax.add_patch(pp1)
-        # ax.plot(*list(zip(*verts)), ".", zorder=1, color="#ff000040")
+    def _limits(self, verts):
+        """Axis limits for `verts`: the viewport, or their bounds with a 10% margin. None if they have no extent."""
+        if self.viewport is not None:
+            xmin, ymin, xmax, ymax = self.viewport
+            return (xmin, xmax), (ymin, ymax)
 
         xmin = verts[:,0].min()
         xmax = verts[:,0].max()
@@ -622,10 +2396,49 @@ class Plot:
         bx = (xmax - xmin) * 0.1
 
         if bx == 0 and by == 0:
+            return None
+        return (xmin - bx, xmax + bx), (ymin - by, ymax + by)
+
+    def save_png(self, file, scale=1, path=None):
+        """Rasterize the plot, or `path` as taken by `show`, to a PNG the size `show` would draw, without matplotlib."""
+        if path is None:
+            codes, verts = self.get_path()
+        elif isinstance(path, (str, os.PathLike)):
+            codes, verts = load_path(path)
+        else:
+            codes, verts = path
+
+        size = (round(800 * scale), round(600 * scale))
+        limits = self._limits(verts) if len(verts) else None
+        write_png(file, rasterize(codes, verts, size, limits))
+
+    def save(self, file, dtype="float64"):
+        """Write the path to `file` with `save_path`."""
+        save_path(file, *self.get_path(), dtype=dtype)
+
+    def show(self, scale=1, path=None):
+        """Draw the plot, or `path`: `(codes, verts)` or a file written by `save_path`."""
+        if path is None:
+            codes, verts = self.get_path()
+        elif isinstance(path, (str, os.PathLike)):
+            codes, verts = load_path(path)
+        else:
+            codes, verts = path
+
+        # t0 = time.time()
+
+        fig, ax = plt.subplots(figsize=(8*scale, 6*scale))
+        pp1 = mpatches.PathPatch(Path(verts, codes), zorder=2, fill=False)
+
+        ax.add_patch(pp1)
+        # ax.plot(*list(zip(*verts)), ".", zorder=1, color="#ff000040")
+
+        limits = self._limits(verts)
+        if limits is None:
             return
 
-        ax.set_xlim(xmin - bx, xmax + bx)
-        ax.set_ylim(ymin - by, ymax + by)
+        ax.set_xlim(*limits[0])
+        ax.set_ylim(*limits[1])
         ax.grid(zorder=-1, color="#111")
         ax.set_aspect('equal')
 
@@ -636,6 +2449,12 @@ class Plot:
 
 
 if __name__ == "__main__":
+    with open(sys.argv[1], "rb") as f:
+        saved = f.read(len(PATH_MAGIC)) == PATH_MAGIC
+    if saved:
+        Plot().show(path=sys.argv[1])
+        sys.exit()
+
     with open(sys.argv[1], "r", encoding="utf8") as f:
         prog = Compiler.compile(f.read())
 
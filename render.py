@@ -1,13 +1,26 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import pickle
 import random
 import re
+import signal
+import socketserver
+import stat
 import sys
+import threading
+import time
 import mcesre
+import numpy as np
+from mcesre import Path
 
 random.seed(42)
 
-
 with open("scripts/cursive.sh", "r") as f:
-    prog = mcesre.Compiler.compile(f.read())
+    source = f.read()
+prog = mcesre.Compiler.compile(source)
 
 fn_names, addr_argc = list(zip(*prog.functions.items()))
 addrs, _ = zip(*addr_argc)
@@ -69,144 +82,259 @@ class Char:
             variants = []
         self.variants = variants
 
-    def path(self):
-        return random.choice(self.variants).path()
+    def path(self, rng=random):
+        return rng.choice(self.variants).path()
 
-    def variant(self, diac):
-        return random.choice([var for var in self.variants if var.has_diac_mark()]).get_diac(diac)
+    def variant(self, diac, rng=random):
+        return rng.choice([var for var in self.variants if var.has_diac_mark()]).get_diac(diac)
 
     def __repr__(self):
         return repr(self.variants)
 
 
-char_fns = [fn for fn in prog.functions if fn.startswith("$chr")]
-re_chr = re.compile(r"^\$chr_(?P<num>\d+)(?P<desc>\w+)?$")
-chars = dict()
-for fn in char_fns:
-    chr_match = re_chr.match(fn)
-    if not chr_match:
-        breakpoint()
-    id = int(chr_match["num"])
-    if id not in chars: chars[id] = Char(id)
-    chars[id].variants.append(
-        Variant(
-            id=id,
-            fn=fn,
-            path=plot.run(prog, fn)
+def pick(c, rng=random):
+    """The variant to draw for `c`, a random one of a `Char`'s."""
+    return rng.choice(c.variants) if isinstance(c, Char) else c
+
+
+def build_tables():
+    """Run every glyph function once: variants with their diacritic
+    expansions, ligatures and products by character id, and substitutions."""
+    char_fns = [fn for fn in prog.functions if fn.startswith("$chr")]
+    re_chr = re.compile(r"^\$chr_(?P<num>\d+)(?P<desc>\w+)?$")
+    chars = dict()
+    for fn in char_fns:
+        chr_match = re_chr.match(fn)
+        if not chr_match:
+            breakpoint()
+        id = int(chr_match["num"])
+        if id not in chars: chars[id] = Char(id)
+        chars[id].variants.append(
+            Variant(
+                id=id,
+                fn=fn,
+                path=plot.run(prog, fn)
+            )
         )
-    )
 
-for char in list(chars.values()):
-    # if char.id > 10: continue  # disable .j
-    vars = []
-    vars.extend(var.get_diac("dot") for var in char.variants if var.has_diac_mark() and not var.fn[-1] in ["i", "u"])
-    vars.extend(var.get_diac("bar") for var in char.variants if var.has_diac_mark() and not var.fn[-1] in ["i", "u"])
-    if vars:
-        id = 20 + char.id % 10
-        if id not in chars:
-            chars[id] = Char(id)
-        chars[id].variants.extend(vars)
-
-    vars = [var.get_diac("trema") for var in char.variants if var.has_diac_mark()]
-    if vars:
-        id = (char.id, char.id)
-        if id not in chars:
-            chars[id] = Char(id)
-        chars[id].variants.extend(vars)
-
-
-# print(chars)
-
-def split_list_0(l):
-    zero = l.index(0)
-    return l[:zero], l[zero+1:]
-
-sub_fns = [split_list_0(plot.run(prog, fn)) for fn in prog.functions if fn.startswith("$sub")]
-# print(sub_fns)
-
-lig_fns = list(fn for fn in prog.functions if fn.startswith("$lig_"))
-# print(lig_fns)
-re_lig = re.compile(
-    r"^\$lig_"
-    r"(?P<d1>\d+)(?P<desc1>[^_]\w*)?"
-    r"_"
-    r"(?P<d2>\d+)(?P<desc2>[^_]\w*)?$"
-)
-for fn in lig_fns:
-    lig_match = re_lig.match(fn)
-    assert lig_match, fn
-
-    id = (int(lig_match["d1"]), int(lig_match["d2"]))
-
-    var = Variant(
-        id=id,
-        fn=fn,
-        path=plot.run(prog, fn)
-    )
-    if id not in chars: chars[id] = Char(id)
-    chars[id].variants.append(var)
+    for char in list(chars.values()):
+        # if char.id > 10: continue  # disable .j
+        vars = []
+        vars.extend(var.get_diac("dot") for var in char.variants if var.has_diac_mark() and not var.fn[-1] in ["i", "u"])
+        vars.extend(var.get_diac("bar") for var in char.variants if var.has_diac_mark() and not var.fn[-1] in ["i", "u"])
+        if vars:
+            id = 20 + char.id % 10
+            if id not in chars:
+                chars[id] = Char(id)
+            chars[id].variants.extend(vars)
 
+        vars = [var.get_diac("trema") for var in char.variants if var.has_diac_mark()]
+        if vars:
+            id = (char.id, char.id)
+            if id not in chars:
+                chars[id] = Char(id)
+            chars[id].variants.extend(vars)
 
-groups = {fn[7:]: plot.run(prog, fn) for fn in prog.functions if fn.startswith("$group_")}
-prod_fns = {fn for fn in prog.functions if fn.startswith("$prod_")}
 
-for fn in prod_fns:
-    g1, g2 = fn[6:].split("_")
-    for chr1 in groups[g1]:
-        chr1_fn = fn_map[chr1]
-        chr1_match = re_chr.match(chr1_fn)
-        for chr2 in groups[g2]:
-            chr2_fn = fn_map[chr2]
-            chr2_match = re_chr.match(chr2_fn)
+    # print(chars)
 
-            id = (int(chr1_match["num"]), int(chr2_match["num"]))
+    def split_list_0(l):
+        zero = l.index(0)
+        return l[:zero], l[zero+1:]
 
-            if id[0] % 10 == id[1] % 10:
-                continue
+    sub_fns = [split_list_0(plot.run(prog, fn)) for fn in prog.functions if fn.startswith("$sub")]
+    # print(sub_fns)
 
-            if id not in chars:
-                chars[id] = Char(id, [])
+    lig_fns = list(fn for fn in prog.functions if fn.startswith("$lig_"))
+    # print(lig_fns)
+    re_lig = re.compile(
+        r"^\$lig_"
+        r"(?P<d1>\d+)(?P<desc1>[^_]\w*)?"
+        r"_"
+        r"(?P<d2>\d+)(?P<desc2>[^_]\w*)?$"
+    )
+    for fn in lig_fns:
+        lig_match = re_lig.match(fn)
+        assert lig_match, fn
 
-            var = Variant(
-                id=id,
-                fn=(fn, chr1_fn, chr2_fn),
-                path=plot.run(prog, fn, chr1, chr2)
-            )
-            chars[id].variants.append(var)
+        id = (int(lig_match["d1"]), int(lig_match["d2"]))
 
-def sub(code):
-    idx = [0] * len(sub_fns)
-    i = 0
-    while i < len(code):
-        for j in range(len(sub_fns)):
-            find, rep = sub_fns[j]
-            if code[i] == find[idx[j]]:
-                idx[j] += 1
-                if idx[j] == len(find):
-                    i -= idx[j]-1
-                    code[i:i+idx[j]] = rep
-                    for j in range(len(sub_fns)):
-                        idx[j] = max(0, idx[j] - len(find))
-                    i -= 1
-                    # i += len(rep)
+        var = Variant(
+            id=id,
+            fn=fn,
+            path=plot.run(prog, fn)
+        )
+        if id not in chars: chars[id] = Char(id)
+        chars[id].variants.append(var)
+
+
+    groups = {fn[7:]: plot.run(prog, fn) for fn in prog.functions if fn.startswith("$group_")}
+    prod_fns = {fn for fn in prog.functions if fn.startswith("$prod_")}
+
+    for fn in prod_fns:
+        g1, g2 = fn[6:].split("_")
+        for chr1 in groups[g1]:
+            chr1_fn = fn_map[chr1]
+            chr1_match = re_chr.match(chr1_fn)
+            for chr2 in groups[g2]:
+                chr2_fn = fn_map[chr2]
+                chr2_match = re_chr.match(chr2_fn)
+
+                id = (int(chr1_match["num"]), int(chr2_match["num"]))
+
+                if id[0] % 10 == id[1] % 10:
+                    continue
+
+                if id not in chars:
+                    chars[id] = Char(id, [])
+
+                var = Variant(
+                    id=id,
+                    fn=(fn, chr1_fn, chr2_fn),
+                    path=plot.run(prog, fn, chr1, chr2)
+                )
+                chars[id].variants.append(var)
+
+    return chars, sub_fns
+
+
+def load_tables(cache_dir=None):
+    """`build_tables`, kept in `cache_dir` or MCESRE_CACHE keyed by a hash of
+    cursive.sh, this file and the compiler.
+    """
+    cache_dir = cache_dir or os.environ.get("MCESRE_CACHE")
+    if not cache_dir:
+        return build_tables()
+
+    # this file builds the tables and reads them back, any change to it may change their layout
+    with open(__file__, "rb") as f:
+        own = hashlib.sha256(f.read()).hexdigest()
+    key = hashlib.sha256(f"{own}\0{mcesre.Compiler.version()}\0{source}".encode("utf8")).hexdigest()
+    path = os.path.join(cache_dir, f"cursive-{key}.pickle")
+
+    # a missing, truncated or foreign entry is rebuilt and overwritten,
+    # whatever unpickling or unpacking it raises
+    try:
+        with open(path, "rb") as f:
+            table, sub_fns = pickle.load(f)
+        chars = {id: Char(id, [Variant(*var) for var in variants]) for id, variants in table}
+        return chars, sub_fns
+    except Exception:
+        pass
+
+    chars, sub_fns = build_tables()
+    # plain tuples, so the file does not depend on where these classes live
+    table = [(id, [(var.id, var.fn, var._path, var.diac) for var in char.variants]) for id, char in chars.items()]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump((table, sub_fns), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+    return chars, sub_fns
+
+
+chars, sub_fns = load_tables()
+
+def sub_automaton(rules):
+    """Compile the substitution `rules` into a transition table.
+
+    States are the tuples of per-rule match counters, so a rule that breaks
+    off does not restart on the symbol that broke it, and after a replacement
+    the counters are shifted back and scanning resumes at the start of the
+    match. Symbols outside every rule return to state 0.
+    """
+    def step(counts, c, start=0):
+        counts = list(counts)
+        for j in range(start, len(rules)):
+            find = rules[j][0]
+            if c == find[counts[j]]:
+                counts[j] += 1
+                if counts[j] == len(find):
+                    return tuple(max(0, k - len(find)) for k in counts), j
             else:
-                idx[j] = 0
-        i += 1
+                counts[j] = 0
+        return tuple(counts), None
+
+    symbols = {c for find, _ in rules for c in find}
+    states = {(0,) * len(rules): 0}
+    order = list(states)
+
+    def state(counts):
+        if counts not in states:
+            states[counts] = len(order)
+            order.append(counts)
+        return states[counts]
+
+    delta, resume = [], {}
+    for counts in order:
+        moves = dict()
+        for c in symbols:
+            nxt, j = step(counts, c)
+            moves[c] = state(nxt), j
+            if j is not None and moves[c] not in resume:
+                # rules after `j` go on to see the symbol before the match
+                resume[moves[c]] = (
+                    {d: state(step(nxt, d, j + 1)[0]) for d in symbols},
+                    state(step(nxt, None, j + 1)[0])
+                )
+        delta.append(moves)
+
+    return delta, resume
+
+
+def sub(code):
+    delta, resume = sub_table
+    out = []
+    pending = code[::-1]
+    state = 0
+    while pending:
+        c = pending.pop()
+        state, j = delta[state].get(c, (0, None))
+        if j is None:
+            out.append(c)
+            continue
+
+        find, rep = sub_fns[j]
+        del out[len(out) - len(find) + 1:]
+        pending.extend(reversed(rep))
+        moves, default = resume[state, j]
+        state = moves.get(out[-1] if out else pending[0], default)
+
+    return out
+
+
+sub_table = sub_automaton(sub_fns)
 
 
 def combine(a, b):
+    """Join `a` and `b` over their longest common run of at least 2 symbols.
+
+    Run lengths are counted backwards, `run[j]` being how far a[i:] and b[j:]
+    agree, over the positions of each symbol in `b` only. Ties go to the
+    smallest `i`, then `j`.
+    """
+    where = dict()
+    for j, c in enumerate(b):
+        where.setdefault(c, []).append(j)
+
     index = None
-    matched = 0
-    for i in range(len(a)):
-        for j in range(len(b)):
-            k = 0
-            while i + k < len(a) and j + k < len(b) and  a[i + k] == b[j + k]:
-                k += 1
-            if k > matched:
-                index = (i, j)
-                matched = k
-
-    if not index or matched < 2:
+    matched = 2
+    run = dict()
+    for i in range(len(a) - 1, -1, -1):
+        row = dict()
+        longest = 0
+        for j in where.get(a[i], ()):
+            k = row[j] = run.get(j + 1, 0) + 1
+            if k > longest:
+                longest, start = k, j
+        if longest >= matched:
+            index = (i, start)
+            matched = longest
+        run = row
+
+    if not index:
         return
 
     # do not match only suffix of `b`
@@ -216,7 +344,7 @@ def combine(a, b):
     return a[:index[0]] + b[index[1]:]
 
 
-def lig(word: list[Char]):
+def lig(word: list[Char], rng=random):
     word = list(word)
     i = 0
     while i < len(word) - 1:
@@ -229,33 +357,33 @@ def lig(word: list[Char]):
 
             elif word[i].id + 10 == word[i+1].id:
                 del word[i+1]
-                word[i] = word[i].variant("acute")
+                word[i] = word[i].variant("acute", rng)
                 word[i].id = word[i].id * 101 + 10
             elif word[i].id == (word[i+1].id - 20) * 101 + 10:
                 del word[i]
-                word[i] = chars[word[i].id - 20].variant("dacute")
+                word[i] = chars[word[i].id - 20].variant("dacute", rng)
                 word[i].id = word[i].id * 10101 + 1020
             elif word[i].id + 20 == word[i+1].id:
                 del word[i+1]
-                word[i] = word[i].variant("caron")
+                word[i] = word[i].variant("caron", rng)
                 word[i].id = word[i].id * 101 + 20
             elif word[i].id == word[i+1].id + 10:
                 del word[i]
-                word[i] = word[i].variant("grave")
+                word[i] = word[i].variant("grave", rng)
                 word[i].id = word[i].id * 101 + 1000
             elif word[i].id == word[i+1].id * 101 + 2010:
                 del word[i]
-                word[i] = word[i].variant("dgrave")
+                word[i] = word[i].variant("dgrave", rng)
                 word[i].id = word[i].id * 10100 + 201000 + word[i].id
             elif word[i].id == word[i+1].id + 20:
                 del word[i]
-                word[i] = word[i].variant("hat")
+                word[i] = word[i].variant("hat", rng)
                 word[i].id = word[i].id * 101 + 2000
         elif type(word[i].id) is tuple and type(word[i+1].id) is int:
             combined_id = (word[i].id[1], word[i+1].id)
             if combined_id in chars:
-                print(word[i].id, word[i+1].id, word[i].path(), chars[combined_id].path())
-                comb = combine(word[i].path(), chars[combined_id].path())
+                print(word[i].id, word[i+1].id, pick(word[i], rng).path(), chars[combined_id].path(rng))
+                comb = combine(pick(word[i], rng).path(), chars[combined_id].path(rng))
                 if comb:
                     word[i] = Variant(word[i].id + (word[i+1].id,), None, comb)
                     del word[i + 1]
@@ -263,25 +391,258 @@ def lig(word: list[Char]):
         i += 1
     return word
 
-text = eval(sys.argv[1])
-
-for i, line in enumerate(text):
-    code = []
-    print(line)
-    line = [lig(lig([chars[c] for c in word])) for word in line]
-    print([[c.id for c in word] for word in line])
-    print("-")
-    for word in line:
-        for c in word:
-            code.extend(c.path())
-        code.append(space)
-
-    sub(code)
-    # print(",".join(map(lambda x: fn_map[x], code)))
-    plot.run(prog, "$call_n", len(code), *code)
-
-    if i < len(text) - 1:
-        plot.run(prog, "$newline")
-
+class Layout:
+    """Draws lines of glyph addresses the way `$call_n` does, without the VM.
+
+    Every glyph is run once on a scratch plot for its points relative to the
+    pen and its advance, separately for a pen left by a move or by a line.
+    Glyphs whose output depends on anything else drawn before them, the
+    stack, the loop counter, or that leave the transform changed, are marked
+    unusable and their lines go through `$call_n`.
+    """
+    # points drawn before a glyph is measured, the last one is the pen
+    history = [
+        (np.array([-4.0, -1.5, 0.5, 0.0]), np.array([0.0, 2.0, -1.0, 0.0])),
+        (np.array([3.0, 0.5, -2.5, 0.0]), np.array([-1.0, 1.5, 0.5, 0.0])),
+    ]
+
+    def __init__(self, prog):
+        self.prog = prog
+        self.names = {addr: fn for fn, (addr, argc) in prog.functions.items() if not argc}
+        self.glyphs = dict()
+
+    def glyph(self, addr, after_move):
+        """`(codes, verts, advance)` of glyph `addr` in local units, or None if it can not be placed."""
+        key = (addr, after_move)
+        if key not in self.glyphs:
+            self.glyphs[key] = self._measure(addr, after_move)
+        return self.glyphs[key]
+
+    def _measure(self, addr, after_move):
+        if addr not in self.names:
+            return None
+
+        cmds = [Path.MOVETO, Path.LINETO, Path.LINETO, Path.MOVETO if after_move else Path.LINETO]
+        runs = []
+        for iteration, (xs, ys) in enumerate(self.history):
+            verts = np.column_stack([xs, ys])
+            scratch = mcesre.Plot()
+            scratch.size = 0
+            scratch.add_points(cmds, verts)
+            scratch.state.iteration = iteration
+            try:
+                # memo hits are replayed through an inverse, keep both runs exact
+                stack = scratch.run(self.prog, self.names[addr], memoize=False)
+            except (AssertionError, IndexError):
+                return None
+
+            state = scratch.state
+            n = len(cmds)
+            if (stack or scratch.instances or (state.a, state.b, state.c, state.d) != (1, 0, 0, 1)
+                    or scratch.size < n or (scratch.cmds[:n] != cmds).any() or (scratch.verts[:n] != verts).any()
+                    or scratch.last_point() != [state.x, state.y]):
+                return None
+            runs.append((scratch.cmds[n:].copy(), scratch.verts[n:].copy(), (state.x, state.y)))
+
+        (c0, v0, a0), (c1, v1, a1) = runs
+        if a0 != a1 or not np.array_equal(c0, c1) or not np.array_equal(v0, v1):
+            return None
+        return runs[0]
+
+    def place(self, plot, code):
+        """Draw `code` on `plot` as `$call_n` would, return False if the line has to be run instead."""
+        state = plot.state
+        if plot.instanced or plot.viewport is not None or plot.output is not None:
+            return False
+        if plot.last_point() != [state.x, state.y]:
+            return False
+
+        after_move = plot.last_cmd() == Path.MOVETO
+        cmds, verts, advance = [], [], []
+        for addr in code:
+            glyph = self.glyph(addr, after_move)
+            if glyph is None:
+                return False
+            cmds.append(glyph[0])
+            verts.append(glyph[1])
+            advance.append(glyph[2])
+            if len(glyph[0]):
+                after_move = glyph[0][-1] == Path.MOVETO
+
+        # pen at the start of every glyph, repeated for each of its points
+        start = np.cumsum([(0.0, 0.0)] + advance[:-1], axis=0)
+        counts = [len(c) for c in cmds]
+        local = np.concatenate(verts) + np.repeat(start, counts, axis=0)
+
+        plot.add_points(np.concatenate(cmds), local @ state.transformation_matrix.T + (state.x, state.y))
+        plot.add_point(Path.MOVETO, (state.x, state.y))
+        return True
+
+
+layout = Layout(prog)
+
+# guards everything above that rendering touches: `prog` and its memo, the
+# tables, `layout` and the global `random` state, for every `Renderer` at once
+lock = threading.Lock()
+
+
+class Renderer:
+    """Renders texts with cursive.sh, keeping the compiled program, its memo,
+    the glyph tables and the layout warm from one text to the next.
+
+    These are module globals shared by every renderer, so texts are laid out
+    one at a time under `lock`. Writing the output goes on alongside, with at
+    most `jobs` requests in flight when serving.
+    """
+    def __init__(self, jobs=1):
+        self.slots = threading.BoundedSemaphore(jobs)
+
+    def render(self, text, rng=random, echo=False):
+        """Draw `text`, lines of words of character ids, on a new plot. `echo` prints each line as it is laid out."""
+        plot = mcesre.Plot()
+        with lock:
+            plot.run_code(".4i")
+            for i, line in enumerate(text):
+                code = []
+                if echo:
+                    print(line)
+                line = [lig(lig([chars[c] for c in word], rng), rng) for word in line]
+                if echo:
+                    print([[c.id for c in word] for word in line])
+                    print("-")
+                for word in line:
+                    for c in word:
+                        code.extend(pick(c, rng).path())
+                    code.append(space)
+
+                code = sub(code)
+                # print(",".join(map(lambda x: fn_map[x], code)))
+                if not layout.place(plot, code):
+                    plot.run(prog, "$call_n", len(code), *code)
+
+                if i < len(text) - 1:
+                    plot.run(prog, "$newline")
+        return plot
+
+    def job(self, request, queued=None):
+        """Answer one request, a dict as described in `serve`."""
+        t0 = time.perf_counter()
+        text = request["text"]
+        if isinstance(text, str):
+            text = ast.literal_eval(text)
+        else:
+            # JSON has no tuples
+            text = [[[tuple(c) if isinstance(c, list) else c for c in word] for word in line] for line in text]
+
+        plot = self.render(text, random.Random(request.get("seed")))
+        t1 = time.perf_counter()
+
+        response = {"id": request.get("id"), "points": plot.size}
+        kind, out = request.get("format", "path"), request.get("out")
+        if kind == "png":
+            if not out:
+                raise ValueError("png output needs `out`")
+            plot.save_png(out, request.get("scale", 1))
+            response["out"] = out
+        elif kind == "path":
+            codes, verts = plot.get_path()
+            if out:
+                mcesre.save_path(out, codes, verts)
+                response["out"] = out
+            else:
+                response["codes"] = codes.tolist()
+                response["verts"] = verts.tolist()
+        else:
+            raise ValueError(f"unknown format {kind!r}")
+        t2 = time.perf_counter()
+
+        response["ms"] = {
+            "wait": round((t0 - queued) * 1000, 3) if queued is not None else 0.0,
+            "render": round((t1 - t0) * 1000, 3),
+            "output": round((t2 - t1) * 1000, 3),
+        }
+        return response
+
+    def serve(self, lines, write):
+        """Answer JSON requests, one per line of `lines`, with a JSON line each through `write`, in the order they finish.
+
+        A request is `{"text": ..., "format": "path" | "png", "out": file,
+        "scale": 1, "seed": None, "id": None}`: `text` as for `render`, or its
+        Python literal as a string. Paths without `out` come back inline as
+        `codes` and `verts`. Responses carry the `id`, the point count and
+        the time in ms spent waiting for a slot, rendering and writing, or an
+        `error`.
+        """
+        written = threading.Lock()
+        threads = []
+
+        def run(line, queued):
+            request = None
+            try:
+                request = json.loads(line)
+                response = self.job(request, queued)
+            except Exception as e:
+                response = {"id": request.get("id") if isinstance(request, dict) else None, "error": f"{type(e).__name__}: {e}"}
+            finally:
+                self.slots.release()
+
+            print(f"job {response['id']}: {response.get('error') or response['ms']}", file=sys.stderr)
+            with written:
+                write(json.dumps(response) + "\n")
+
+        for line in lines:
+            if not line.strip():
+                continue
+            queued = time.perf_counter()
+            self.slots.acquire()
+            threads = [t for t in threads if t.is_alive()]
+            threads.append(threading.Thread(target=run, args=(line, queued), daemon=True))
+            threads[-1].start()
+
+        for t in threads:
+            t.join()
+
+    def listen(self, path):
+        """`serve` every connection to the Unix socket `path` until interrupted."""
+        renderer = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                renderer.serve(self.rfile, lambda s: self.wfile.write(s.encode("utf8")))
+
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+            server.daemon_threads = True
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(path)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        parser = argparse.ArgumentParser(prog="render.py --serve", description="Render JSON requests, see Renderer.serve.")
+        parser.add_argument("socket", nargs="?", help="Unix socket to listen on, stdin and stdout if left out")
+        parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="requests in flight at once")
+        args = parser.parse_args(sys.argv[2:])
+
+        renderer = Renderer(args.jobs)
+        # `lig` prints as it goes, keep stdout for the responses
+        out, sys.stdout = sys.stdout, sys.stderr
+
+        def write(s):
+            out.write(s)
+            out.flush()
+
+        if args.socket:
+            # exit cleanly so the socket is removed
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+            renderer.listen(args.socket)
+        else:
+            renderer.serve(sys.stdin, write)
+        sys.exit()
 
-plot.show(2)
+    text = eval(sys.argv[1])
+    plot = Renderer().render(text, echo=True)
+    plot.show(2)